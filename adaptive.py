@@ -0,0 +1,116 @@
+#adaptive search for critical parameter values (where a metric changes sign)
+#noisy bisection puts the trials near the crossing instead of on a dense grid
+import copy
+import numpy as np
+from config import GameConfig
+from simulation import run_monte_carlo
+from sweep import apply_params
+
+
+def trial_metric(strategy, baseline, field='avg_wealth'):
+    """Per-trial metric: strategy minus baseline, e.g. the RA-TFT advantage over TFT.
+
+    >>> metric = trial_metric('Reputation Aware TFT', 'TFT')
+    >>> metric({'Reputation Aware TFT': {'avg_wealth': 30.0}, 'TFT': {'avg_wealth': 25.0}})
+    5.0
+    """
+    def metric(trial_result):
+        return trial_result[strategy][field] - trial_result[baseline][field]
+    return metric
+
+
+def _linear_root(xs, ys):
+    slope, intercept = np.polyfit(xs, ys, 1)
+    return -intercept / slope if slope != 0 else np.nan
+
+
+def bisect_threshold(evaluate, low, high, trials=20, max_trials=160, max_evals=10,
+                     tol=None, confidence=0.95, n_boot=1000, seed=None):
+    """
+    evaluate(x, n) returns n per-trial metric values at x. Before each
+    bisection step the midpoint gets more trials (up to max_trials) while
+    its mean is within the confidence band of zero. The critical value is
+    the root of a linear fit through the points nearest the final bracket,
+    and its interval comes from bootstrapping the per-trial values.
+
+    >>> rng = np.random.default_rng(0)
+    >>> result = bisect_threshold(lambda x, n: 0.15 - x + rng.normal(0, 0.05, n),
+    ...                           0.0, 0.3, max_evals=8, seed=0)
+    >>> abs(result['critical'] - 0.15) < 0.02
+    True
+    >>> result['ci'][0] < result['critical'] < result['ci'][1]
+    True
+    """
+    z = {0.9: 1.645, 0.95: 1.96, 0.99: 2.576}.get(confidence, 1.96)
+    values = {}
+
+    def mean_at(x):
+        if x not in values:
+            values[x] = np.asarray(evaluate(x, trials), dtype=float)
+        v = values[x]
+        while len(v) < max_trials and abs(v.mean()) < z * v.std(ddof=1) / np.sqrt(len(v)):
+            v = np.concatenate([v, evaluate(x, len(v))])
+        values[x] = v
+        return v.mean()
+
+    lo, hi = low, high
+    m_lo, m_hi = mean_at(lo), mean_at(hi)
+    if np.sign(m_lo) == np.sign(m_hi):
+        raise ValueError(f"metric does not change sign on [{low}, {high}]: {m_lo:.3g}, {m_hi:.3g}")
+
+    for _ in range(max_evals):
+        if tol is not None and hi - lo < tol:
+            break
+        mid = (lo + hi) / 2
+        if np.sign(mean_at(mid)) == np.sign(m_lo):
+            lo = mid
+        else:
+            hi = mid
+
+    center = (lo + hi) / 2
+    near = sorted(values, key=lambda x: abs(x - center))[:4]
+    xs = np.array(near)
+    critical = _linear_root(xs, [values[x].mean() for x in near])
+
+    rng = np.random.default_rng(seed)
+    boot = []
+    for _ in range(n_boot):
+        ys = [rng.choice(values[x], len(values[x])).mean() for x in near]
+        boot.append(_linear_root(xs, ys))
+    boot = np.array(boot)
+    boot = boot[np.isfinite(boot)]
+    tail = (1 - confidence) / 2 * 100
+
+    return {
+        'critical': float(np.clip(critical, low, high)),
+        'ci': tuple(float(np.clip(q, low, high)) for q in np.percentile(boot, [tail, 100 - tail])),
+        'bracket': (lo, hi),
+        'simulations': sum(len(v) for v in values.values()),
+        'points': {x: (float(v.mean()), len(v)) for x, v in sorted(values.items())},
+    }
+
+
+def find_threshold(field, low, high, metric, base=None, **kwargs):
+    """
+    Critical value of one GameConfig field (any sweep.apply_params path)
+    at which `metric` (per analyze_trial result) changes sign.
+
+    e.g. the noise level where the RA-TFT advantage over TFT vanishes:
+    find_threshold('noise', 0.0, 0.3, trial_metric('Reputation Aware TFT', 'TFT'))
+    or the K where Coalition Builder stops beating TFT:
+    find_threshold('network_threshold', 1.0, 12.0, trial_metric('Coalition Builder', 'TFT'),
+                   base={'alpha_c': 0.0, 'alpha_d': 0.0})
+    """
+    base_config = GameConfig(**(base or {}))
+    calls = []
+
+    def evaluate(x, n):
+        config = apply_params(copy.deepcopy(base_config), {field: x})
+        config.num_trials = n
+        # top-up batches at the same x must not replay the same seeded trials
+        if base_config.seed is not None:
+            calls.append(x)
+            config.seed = [base_config.seed, len(calls)]
+        return [metric(trial) for trial in run_monte_carlo(config)]
+
+    return bisect_threshold(evaluate, low, high, **kwargs)
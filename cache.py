@@ -0,0 +1,53 @@
+#helpers for files the runners write while others may read them: atomic JSON/text
+#writes (caches, queue units, metrics) and the engine fingerprint that result-cache
+#keys include, so any change to the simulation code re-runs instead of replaying
+import hashlib
+import importlib.util
+import json
+import os
+import socket
+
+
+#every module whose code can change a trial's outcome
+ENGINE_MODULES = ('config', 'simulation', 'environment', 'player', 'rng', 'kernel',
+                  'steady_state', 'topology', 'matchmaking', 'coalitions')
+
+
+def engine_fingerprint():
+    """sha1 over the engine sources.
+
+    >>> len(engine_fingerprint()), engine_fingerprint() == engine_fingerprint()
+    (40, True)
+    """
+    digest = hashlib.sha1()
+    for name in ENGINE_MODULES:
+        # located without importing, so kernel (and numba) stay unloaded
+        with open(importlib.util.find_spec(name).origin, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def write_atomic(path, text):
+    """Write `text` to `path` through a temporary file and os.replace, so readers
+    (other processes or nodes on a shared filesystem) never see a partial file.
+
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'sub', 'point.json')
+    >>> write_json(path, {'TFT': {'wealth_mean': 1.5}})
+    >>> read_json(path), os.listdir(os.path.dirname(path))
+    ({'TFT': {'wealth_mean': 1.5}}, ['point.json'])
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f'{path}.{socket.gethostname()}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def write_json(path, obj):
+    write_atomic(path, json.dumps(obj))
+
+
+def read_json(path):
+    with open(path) as f:
+        return json.load(f)
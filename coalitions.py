@@ -0,0 +1,104 @@
+#coalitions = connected components of the trust graph (edges with weight >= K)
+#union-find handles new trusted edges incrementally; removals trigger a periodic rebuild
+
+
+class CoalitionTracker:
+    """
+    Only components with at least two players count as coalitions.
+
+    >>> tracker = CoalitionTracker(['TFT', 'TFT', 'AllC', 'AllD'], threshold=4.0, rebuild_every=1)
+    >>> tracker.edge_changed(0, 1, True)
+    >>> tracker.edge_changed(1, 2, True)
+    >>> tracker.stats()
+    {'coalitions': 1, 'largest': 3, 'members': {'TFT': 2, 'AllC': 1}}
+    >>> tracker.edge_changed(0, 1, False)
+    >>> tracker.end_round(0)['coalitions'], tracker.largest
+    (1, 2)
+    >>> tracker.history[-1]
+    {'coalitions': 1, 'largest': 2, 'members': {'TFT': 1, 'AllC': 1}, 'round': 0}
+    """
+    def __init__(self, strategy_names, threshold, rebuild_every=10):
+        self.strategy_names = list(strategy_names)
+        self.threshold = threshold
+        self.n = len(self.strategy_names)
+        self.rebuild_every = rebuild_every
+        self.trusted = set()
+        self.removed = set()
+        self.history = []
+        self._reset()
+
+    def _reset(self):
+        self.parent = list(range(self.n))
+        self.size = [1] * self.n
+        self.counts = [{name: 1} for name in self.strategy_names]
+        self.num_coalitions = 0
+        self.largest = 1 if self.n else 0
+        self.members = {}
+        self.dirty = False
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return
+        if self.size[ra] < self.size[rb]:
+            ra, rb = rb, ra
+        # a singleton joining a coalition adds its strategy to the member counts
+        for root in (ra, rb):
+            if self.size[root] == 1:
+                for name, c in self.counts[root].items():
+                    self.members[name] = self.members.get(name, 0) + c
+        self.num_coalitions += 1 - (self.size[ra] >= 2) - (self.size[rb] >= 2)
+        self.parent[rb] = ra
+        self.size[ra] += self.size[rb]
+        for name, c in self.counts[rb].items():
+            self.counts[ra][name] = self.counts[ra].get(name, 0) + c
+        self.counts[rb] = None
+        self.largest = max(self.largest, self.size[ra])
+
+    def edge_changed(self, a, b, trusted):
+        edge = (a, b) if a < b else (b, a)
+        if trusted:
+            self.trusted.add(edge)
+            if a not in self.removed and b not in self.removed:
+                self.union(a, b)
+        else:
+            self.trusted.discard(edge)
+            self.dirty = True
+
+    def remove_node(self, i):
+        self.removed.add(i)
+        self.dirty = True
+
+    def rebuild(self):
+        self._reset()
+        for a, b in self.trusted:
+            if a not in self.removed and b not in self.removed:
+                self.union(a, b)
+
+    def stats(self):
+        return {
+            'coalitions': self.num_coalitions,
+            'largest': self.largest,
+            'members': dict(self.members),
+        }
+
+    def end_round(self, round_num):
+        if self.dirty and (round_num + 1) % self.rebuild_every == 0:
+            self.rebuild()
+        stats = self.stats()
+        stats['round'] = round_num
+        self.history.append(stats)
+        return stats
+
+    def component_sizes(self):
+        """Exact coalition size of every player, rebuilding first if needed."""
+        if self.dirty:
+            self.rebuild()
+        return [self.size[self.find(i)] for i in range(self.n)]
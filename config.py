@@ -18,7 +18,26 @@ class GameConfig:
                  network_threshold=4.0,
 
                  gtft_forgiveness=0.1,
-                 ratft_high_rep_threshold=0.3):
+                 ratft_high_rep_threshold=0.3,
+
+                 topology=None,
+                 topology_degree=4,
+                 rewire_prob=0.1,
+
+                 matching='random',
+                 choice_reputation_bias=2.0,
+                 choice_trust_bias=1.0,
+
+                 track_coalitions=False,
+                 coalition_rebuild_every=10,
+
+                 fast_forward='exact',
+                 steady_window=100,
+                 fast_forward_tol=0.25,
+
+                 seed=None,
+
+                 engine='python'):
         self.payoff = {
             ("C", "C"): (2, 2),
             ("C", "D"): (-5, 6),
@@ -50,6 +69,32 @@ class GameConfig:
         self.gtft_forgiveness = gtft_forgiveness
         self.ratft_high_rep_threshold = ratft_high_rep_threshold
 
+        # None keeps the fully mixed population of random_pairing
+        self.topology = topology
+        self.topology_degree = topology_degree
+        self.rewire_prob = rewire_prob
+
+        # 'partner_choice' samples partners by reputation and network weight
+        self.matching = matching
+        self.choice_reputation_bias = choice_reputation_bias
+        self.choice_trust_bias = choice_trust_bias
+
+        # coalitions = connected components of edges with weight >= network_threshold
+        self.track_coalitions = track_coalitions
+        self.coalition_rebuild_every = coalition_rebuild_every
+
+        # 'exact' skips rounds only when the outcome is known in closed form,
+        # 'approx' also extrapolates stationary noisy trials, False disables it
+        self.fast_forward = fast_forward
+        self.steady_window = steady_window
+        self.fast_forward_tol = fast_forward_tol
+
+        # seeds the per-trial RandomStreams; None draws fresh OS entropy
+        self.seed = seed
+
+        # 'jit' runs trials on the numba round kernel (kernel.py) when available
+        self.engine = engine
+
 
 def create_h1_configs():
     h1_player_counts = {
@@ -98,7 +143,8 @@ def create_h2_configs():
             player_counts=h2_player_counts,
             network_threshold=threshold,
             alpha_c=0.0,
-            alpha_d = 0.0
+            alpha_d = 0.0,
+            track_coalitions=True
         )
         for name, threshold in thresholds.items()
     }
@@ -0,0 +1,210 @@
+#runtime and memory cost model for experiment plans, calibrated on this machine
+#  python cost_model.py --calibrate        re-measure and save results/cost_model/model.json
+#  python experiments.py --dry-run         predicted wall time / peak memory per config
+import json
+import os
+import time
+import tracemalloc
+from config import GameConfig, create_h1_configs, create_h2_configs, create_h3_configs
+from rendering import RESULTS_DIR
+from simulation import run_simulation
+from shared_results import run_monte_carlo_shared
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+#its own directory: results/*.json is where rendering.py looks for figures
+MODEL_PATH = os.path.join(RESULTS_DIR, 'cost_model', 'model.json')
+
+EXPERIMENT_PLAN = {
+    'H1': create_h1_configs,
+    'H2': create_h2_configs,
+    'H3': create_h3_configs,
+}
+
+
+def _benchmark_config(**kwargs):
+    # the default 80-player mixed population, noisy so fast-forward never triggers
+    return GameConfig(num_rounds=300, fast_forward=False, seed=0, **kwargs)
+
+
+def _seconds_per_player_round(config, repeats=3):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run_simulation(config)
+        best = min(best, time.perf_counter() - start)
+    return best / (config.num_rounds * sum(config.player_counts.values()))
+
+
+def calibrate(workers=None, path=MODEL_PATH):
+    """
+    Benchmark this machine and save the model:
+    seconds per player-round for each engine (and with coalition tracking),
+    parallel efficiency for each worker count, and bytes per player-round of
+    live trial state.
+    """
+    import kernel
+    cpus = os.cpu_count() or 1
+    workers = workers or sorted({1, 2, 4, cpus} & set(range(1, cpus + 1)))
+    model = {'cpus': cpus, 'engines': {}, 'workers': {}}
+
+    base = _benchmark_config()
+    model['engines']['python'] = _seconds_per_player_round(base)
+    model['coalition_factor'] = _seconds_per_player_round(_benchmark_config(track_coalitions=True)) \
+        / model['engines']['python']
+    if kernel.HAVE_NUMBA:
+        jit = _benchmark_config(engine='jit')
+        start = time.perf_counter()
+        run_simulation(jit)
+        model['jit_compile_seconds'] = time.perf_counter() - start
+        model['engines']['jit'] = _seconds_per_player_round(jit)
+
+    # parallel efficiency: serial wall time / (workers * parallel wall time), same batch
+    batch = _benchmark_config(num_trials=4 * max(workers))
+    batch.num_rounds = 150
+    wall = {}
+    for w in [1] + [w for w in workers if w > 1]:
+        start = time.perf_counter()
+        run_monte_carlo_shared(batch, workers=w)
+        wall[w] = time.perf_counter() - start
+        model['workers'][str(w)] = min(1.0, wall[1] / (w * wall[w]))
+
+    tracemalloc.start()
+    run_simulation(base)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    model['bytes_per_player_round'] = peak / (base.num_rounds * sum(base.player_counts.values()))
+    model['process_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 if resource else 0
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(model, f, indent=2)
+    return model
+
+
+def load_model(path=MODEL_PATH, recalibrate=False):
+    if recalibrate or not os.path.exists(path):
+        print(f"Calibrating cost model -> {path}")
+        return calibrate(path=path)
+    with open(path) as f:
+        return json.load(f)
+
+
+def _efficiency(model, workers):
+    # nearest calibrated worker count at or below the requested one
+    measured = sorted(int(w) for w in model['workers'])
+    below = [w for w in measured if w <= workers] or measured[:1]
+    return model['workers'][str(below[-1])]
+
+
+def estimate(config, model, workers=1):
+    """
+    Predicted wall seconds and peak bytes of one experiment config, run the
+    way experiments.run_config runs it: over `workers` processes, or serially
+    when it tracks coalitions. Bankruptcies are priced in as in the benchmark
+    population. Every round is priced, so when `fast_forward` flags a config
+    whose trials can skip ahead (noise 0, or 'approx'), the time is only an
+    upper bound and can be many times too high.
+
+    >>> model = {'cpus': 8, 'engines': {'python': 1e-6}, 'workers': {'1': 1.0, '4': 0.75},
+    ...          'coalition_factor': 1.5, 'bytes_per_player_round': 100.0, 'process_bytes': 0}
+    >>> config = GameConfig(num_rounds=1000, num_trials=12, player_counts={'TFT': 100})
+    >>> cost = estimate(config, model)
+    >>> round(cost['seconds'], 6), cost['peak_bytes']
+    (1.2, 10000000.0)
+    >>> round(estimate(config, model, workers=4)['seconds'], 6)
+    0.4
+    >>> round(estimate(config, model, workers=16)['seconds'], 6)
+    0.2
+    >>> cost['fast_forward'], estimate(GameConfig(noise=0.0), model)['fast_forward']
+    (False, True)
+    >>> config.track_coalitions = True
+    >>> round(estimate(config, model)['seconds'], 6), round(estimate(config, model, workers=4)['seconds'], 6)
+    (1.8, 1.8)
+    """
+    players = sum(config.player_counts.values())
+    player_rounds = players * config.num_rounds
+    engine = config.engine
+    if engine == 'jit' and 'jit' not in model['engines']:
+        engine = 'python'
+    if engine == 'jit':
+        import kernel
+        if not kernel.supports(config):
+            engine = 'python'
+    per_trial = model['engines'][engine] * player_rounds
+    if config.track_coalitions:
+        per_trial *= model['coalition_factor']
+        workers = 1
+    workers = max(1, min(workers, config.num_trials))
+    # more workers than cores only adds processes, not speed
+    busy = min(workers, model['cpus'])
+    seconds = per_trial * config.num_trials / (busy * _efficiency(model, busy))
+    if engine == 'jit':
+        seconds += model.get('jit_compile_seconds', 0.0)
+        trial_bytes = players * players * 10
+    else:
+        trial_bytes = model['bytes_per_player_round'] * player_rounds
+    # mirrors run_simulation: the kernel, traces and coalition series never skip
+    fast_forward = bool(config.fast_forward) and engine == 'python' and not config.track_coalitions \
+        and (config.noise == 0 or config.fast_forward == 'approx')
+    return {'seconds': seconds, 'peak_bytes': workers * (trial_bytes + model['process_bytes']),
+            'fast_forward': fast_forward}
+
+
+def format_seconds(seconds):
+    """
+    >>> format_seconds(42.0), format_seconds(3 * 3600 + 120)
+    ('42s', '3h02m')
+    """
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    if seconds < 3600:
+        return f"{int(seconds // 60)}m{int(seconds % 60):02d}s"
+    return f"{int(seconds // 3600)}h{int(seconds % 3600 // 60):02d}m"
+
+
+def dry_run(workers=1, engine=None, model=None, recalibrate=False):
+    """Print predicted wall time and peak memory for every experiment config."""
+    model = model or load_model(recalibrate=recalibrate)
+    total = 0.0
+    peak = 0.0
+    flagged = False
+    for hypothesis, make_configs in EXPERIMENT_PLAN.items():
+        print(f"\n{hypothesis}")
+        print(f"{'Config':22s} {'Trials':>7s} {'Rounds':>7s} {'Players':>8s} {'Time':>10s} {'Peak mem':>10s}")
+        subtotal = 0.0
+        for name, config in make_configs().items():
+            if engine is not None:
+                config.engine = engine
+            cost = estimate(config, model, workers)
+            subtotal += cost['seconds']
+            peak = max(peak, cost['peak_bytes'])
+            flagged |= cost['fast_forward']
+            marks = ('*' if cost['fast_forward'] else '') + ('s' if config.track_coalitions and workers > 1 else '')
+            print(f"{name:22s} {config.num_trials:>7d} {config.num_rounds:>7d} "
+                  f"{sum(config.player_counts.values()):>8d} {format_seconds(cost['seconds']):>10s} "
+                  f"{cost['peak_bytes'] / 2 ** 20:>8.0f}MB {marks}".rstrip())
+        print(f"{hypothesis + ' total':22s} {'':>7s} {'':>7s} {'':>8s} {format_seconds(subtotal):>10s}")
+        total += subtotal
+    print(f"\nAll experiments: {format_seconds(total)} with {workers} worker(s), "
+          f"peak {peak / 2 ** 20:.0f}MB")
+    if flagged:
+        print("* trials can fast-forward; the time assumes every round is played and may be far too high")
+    if workers > 1:
+        print("s coalition-tracking config, runs serially")
+    return total
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="calibrate the runtime cost model")
+    parser.add_argument('--calibrate', action='store_true')
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+    if args.calibrate:
+        print(json.dumps(calibrate(), indent=2))
+    dry_run(args.workers)
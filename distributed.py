@@ -0,0 +1,259 @@
+#multi-node sweeps through a shared-filesystem work queue
+#queue_dir/{pending,claimed,done,failed}/<unit>.json; os.rename is the atomic claim
+#
+#  coordinator: submit(...) -> requeue_stale(...) while waiting -> collect(...)
+#  workers:     python distributed.py worker QUEUE_DIR   (any node that sees the directory)
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import numpy as np
+from sweep import apply_params, config_key, make_configs, sample_points, to_frame
+from config import GameConfig
+from simulation import run_simulation, analyze_trial, aggregate_monte_carlo_results
+from rng import trial_seeds
+from cache import read_json, write_json
+
+
+STATES = ('pending', 'claimed', 'done', 'failed')
+
+
+def _dirs(queue_dir):
+    dirs = {state: os.path.join(queue_dir, state) for state in STATES}
+    for d in dirs.values():
+        os.makedirs(d, exist_ok=True)
+    return dirs
+
+
+def submit(queue_dir, points, base=None, trials_per_unit=10, seed=None):
+    """
+    Turn sweep points into work units of at most trials_per_unit trials.
+
+    Unit ids derive from the config (including its seed), so submitting the
+    same sweep again only adds units that are neither queued nor finished.
+    Pass a seed to make a sweep resumable across coordinator restarts.
+    Returns {point id: params}.
+    """
+    dirs = _dirs(queue_dir)
+    base = dict(base or {})
+    seeds = np.random.SeedSequence(seed if seed is not None else base.get('seed')).spawn(len(points))
+    point_ids = {}
+    for params, config, point_seed in zip(points, make_configs(points, base), seeds):
+        # every trial seed is fixed here, so any worker reproduces the same trial
+        config.seed = int(point_seed.generate_state(2, np.uint64)[0])
+        point = config_key(config)
+        point_ids[point] = params
+        for start in range(0, config.num_trials, trials_per_unit):
+            stop = min(start + trials_per_unit, config.num_trials)
+            unit = f'{point}_{start:06d}'
+            if any(os.path.exists(os.path.join(dirs[s], unit + '.json')) for s in STATES):
+                continue
+            write_json(os.path.join(dirs['pending'], unit + '.json'), {
+                'unit': unit, 'point': point, 'params': params, 'base': base,
+                'seed': config.seed, 'num_trials': config.num_trials,
+                'start': start, 'stop': stop, 'attempts': 0,
+            })
+    return point_ids
+
+
+def _claim(dirs):
+    """
+    Move one pending unit to claimed and return its path. The file is touched
+    before the rename, so it never sits in claimed/ with its submit-time mtime
+    where requeue_stale would take it for an expired lease.
+
+    >>> import tempfile
+    >>> queue = tempfile.mkdtemp()
+    >>> _ = submit(queue, [{'noise': 0.0}], base={'num_rounds': 10, 'num_trials': 1})
+    >>> dirs = _dirs(queue)
+    >>> for name in os.listdir(dirs['pending']):
+    ...     os.utime(os.path.join(dirs['pending'], name), (0, 0))
+    >>> os.path.dirname(_claim(dirs)) == dirs['claimed'], requeue_stale(queue, lease=60)
+    (True, 0)
+    """
+    names = os.listdir(dirs['pending'])
+    random.shuffle(names)
+    for name in names:
+        source = os.path.join(dirs['pending'], name)
+        target = os.path.join(dirs['claimed'], name)
+        try:
+            # a unit another worker claimed in between raises here or at the rename
+            os.utime(source)
+            os.rename(source, target)
+        except FileNotFoundError:
+            continue
+        return target
+    return None
+
+
+def run_unit(unit, heartbeat=None):
+    config = apply_params(GameConfig(**unit['base']), unit['params'])
+    config.seed = unit['seed']
+    seeds = trial_seeds(config.seed, unit['num_trials'])
+    trials = []
+    for trial in range(unit['start'], unit['stop']):
+        telemetry = []
+        players = run_simulation(config, telemetry=telemetry, seed=seeds[trial])
+        trials.append(analyze_trial(players, telemetry))
+        if heartbeat is not None:
+            heartbeat()
+    return trials
+
+
+def work(queue_dir, worker_id=None, idle_exit=5.0, poll=0.5, max_units=None):
+    """
+    Claim and run units until the queue stays empty for idle_exit seconds
+    (None = run forever). A unit's claimed file is touched after every trial;
+    the coordinator requeues claims whose heartbeat is older than its lease.
+
+    >>> import tempfile
+    >>> queue = tempfile.mkdtemp()
+    >>> points = submit(queue, [{'noise': 0.0}, {'noise': 0.1}],
+    ...                 base={'num_rounds': 10, 'num_trials': 3}, trials_per_unit=2, seed=1)
+    >>> work(queue, idle_exit=0)
+    4
+    >>> work(queue, idle_exit=0)
+    0
+    >>> summaries = collect(queue)
+    >>> sorted(points) == sorted(summaries)
+    True
+    >>> [s['TFT']['n_trials'] for s in summaries.values()]
+    [3, 3]
+    """
+    dirs = _dirs(queue_dir)
+    worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+    done = 0
+    idle_since = time.time()
+    while max_units is None or done < max_units:
+        path = _claim(dirs)
+        if path is None:
+            if idle_exit is not None and time.time() - idle_since >= idle_exit:
+                break
+            time.sleep(poll)
+            continue
+        try:
+            unit = read_json(path)
+            unit['worker'] = worker_id
+            trials = run_unit(unit, heartbeat=lambda: os.utime(path))
+        except FileNotFoundError:
+            # the lease expired and the coordinator took the unit back
+            continue
+        write_json(os.path.join(dirs['done'], os.path.basename(path)), {**unit, 'trials': trials})
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        done += 1
+        idle_since = time.time()
+    return done
+
+
+def requeue_stale(queue_dir, lease=300.0, max_attempts=3):
+    """Move claims without a heartbeat for `lease` seconds back to pending (or to failed)."""
+    dirs = _dirs(queue_dir)
+    now = time.time()
+    requeued = 0
+    for name in os.listdir(dirs['claimed']):
+        path = os.path.join(dirs['claimed'], name)
+        try:
+            if now - os.path.getmtime(path) < lease:
+                continue
+            unit = read_json(path)
+        except FileNotFoundError:
+            continue
+        unit['attempts'] += 1
+        state = 'failed' if unit['attempts'] >= max_attempts else 'pending'
+        if os.path.exists(os.path.join(dirs['done'], name)):
+            state = None
+        if state is not None:
+            write_json(os.path.join(dirs[state], name), unit)
+            requeued += state == 'pending'
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return requeued
+
+
+def status(queue_dir):
+    dirs = _dirs(queue_dir)
+    return {state: sum(n.endswith('.json') for n in os.listdir(d)) for state, d in dirs.items()}
+
+
+def collect(queue_dir):
+    """
+    Merge finished units into {point id: aggregate summary} for every point
+    whose trials are all done. A unit that ran twice has one file, so merging
+    is idempotent and can be repeated while the sweep is still running.
+    """
+    dirs = _dirs(queue_dir)
+    by_point = {}
+    for name in os.listdir(dirs['done']):
+        if not name.endswith('.json'):
+            continue
+        unit = read_json(os.path.join(dirs['done'], name))
+        by_point.setdefault(unit['point'], []).append(unit)
+    summaries = {}
+    for point, units in by_point.items():
+        units.sort(key=lambda u: u['start'])
+        trials = [t for u in units for t in u['trials']]
+        if len(trials) == units[0]['num_trials']:
+            summaries[point] = aggregate_monte_carlo_results(trials)
+    return summaries
+
+
+def launch_local_workers(queue_dir, n, idle_exit=5.0):
+    """Start n worker processes on this machine (stand-ins for remote nodes)."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    return [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), 'worker', queue_dir,
+                          '--idle-exit', str(idle_exit)], cwd=here)
+        for _ in range(n)
+    ]
+
+
+def run_distributed(queue_dir, ranges, method='grid', n=None, levels=5, seed=0, base=None,
+                    trials_per_unit=10, local_workers=0, lease=300.0, poll=2.0):
+    """
+    Coordinator: submit a sweep, optionally start local workers, requeue lost
+    units until every point is complete, and return the tidy sweep DataFrame.
+    """
+    points = sample_points(ranges, method, n, levels, seed)
+    point_ids = submit(queue_dir, points, base, trials_per_unit, seed)
+    procs = launch_local_workers(queue_dir, local_workers) if local_workers else []
+    try:
+        while True:
+            summaries = collect(queue_dir)
+            if all(p in summaries for p in point_ids):
+                break
+            requeue_stale(queue_dir, lease)
+            if status(queue_dir)['failed']:
+                raise RuntimeError(f"work units failed permanently, see {os.path.join(queue_dir, 'failed')}")
+            time.sleep(poll)
+    finally:
+        for proc in procs:
+            proc.wait()
+    ordered = list(point_ids)
+    summaries = [{s: {k: v.item() if hasattr(v, 'item') else v for k, v in stats.items()}
+                  for s, stats in summaries[p].items()}
+                 for p in ordered]
+    return to_frame([point_ids[p] for p in ordered], summaries)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="shared-filesystem sweep queue")
+    parser.add_argument('command', choices=['worker', 'status', 'requeue'])
+    parser.add_argument('queue_dir')
+    parser.add_argument('--idle-exit', type=float, default=None,
+                        help="worker exits after this many idle seconds (default: never)")
+    parser.add_argument('--lease', type=float, default=300.0)
+    args = parser.parse_args()
+    if args.command == 'worker':
+        print(f"worker finished {work(args.queue_dir, idle_exit=args.idle_exit)} units")
+    elif args.command == 'status':
+        print(status(args.queue_dir))
+    else:
+        print(f"requeued {requeue_stale(args.queue_dir, args.lease)} units")
@@ -1,6 +1,17 @@
 import random
 
 class EnvironmentUpdater:
+    def __init__(self, coalitions=None, trace=None, rng=None):
+        # per-simulation RandomStream; the global random module when not given
+        self.rng = rng or random
+        # optional CoalitionTracker, told whenever an edge crosses the trust threshold
+        self.coalitions = coalitions
+        # optional TraceWriter, play_round records every interaction into it
+        self.trace = trace
+        # running action counts, used for steady-state detection
+        self.cooperations = 0
+        self.actions = 0
+
     def apply_noise(self, action, noise):
         """Flip C/D with probability noise.
 
@@ -13,7 +24,7 @@ class EnvironmentUpdater:
         >>> all(a == 'D' for a in flipped)
         True
         """
-        if random.random() < noise:
+        if self.rng.random() < noise:
             return "D" if action == "C" else "C"
         return action
 
@@ -105,8 +116,16 @@ class EnvironmentUpdater:
         >>> env.update_network(p1, p2, "C", "D", 1.0, 1.0)
         >>> p1.weights[2], p2.weights[1]
         (0, 0)
+
+        >>> from coalitions import CoalitionTracker
+        >>> env = EnvironmentUpdater(CoalitionTracker(['TFT', 'TFT', 'TFT'], threshold=2.0))
+        >>> for _ in range(2):
+        ...     env.update_network(p1, p2, "C", "C", 1.0, 1.0)
+        >>> env.coalitions.stats()['largest']
+        2
         """
-        p1.weights[p2.id] = p1.weights.get(p2.id, 0)
+        old = p1.weights.get(p2.id, 0)
+        p1.weights[p2.id] = old
         p2.weights[p1.id] = p2.weights.get(p1.id, 0)
 
         if a1 == "C" and a2 == "C":
@@ -116,6 +135,12 @@ class EnvironmentUpdater:
             p1.weights[p2.id] = max(0, p1.weights[p2.id] - delta)
             p2.weights[p1.id] = max(0, p2.weights[p1.id] - delta)
 
+        if self.coalitions is not None:
+            was_trusted = old >= self.coalitions.threshold
+            is_trusted = p1.weights[p2.id] >= self.coalitions.threshold
+            if was_trusted != is_trusted:
+                self.coalitions.edge_changed(p1.id, p2.id, is_trusted)
+
     def update_bankruptcy(self, p, threshold):
         """
         >>> class P:
@@ -148,8 +173,12 @@ class EnvironmentUpdater:
         """
         if p.wealth < threshold and not p.bankrupt:
             p.bankrupt = True
+            if self.coalitions is not None:
+                self.coalitions.remove_node(p.id)
 
     def update_all(self, p1, p2, a1, a2, config):
+        self.cooperations += (a1 == "C") + (a2 == "C")
+        self.actions += 2
         self.update_payoff(p1, p2, a1, a2, config)
         self.update_reputation(
             p1, p2, a1, a2,
@@ -1,51 +1,33 @@
 from config import create_h1_configs, create_h2_configs, create_h3_configs
 from simulation import run_monte_carlo, aggregate_monte_carlo_results
+from shared_results import run_monte_carlo_shared
+from rendering import RESULTS_DIR, save_results, render, render_all
+from progress import Progress
 import os
-import matplotlib.pyplot as plt
 
 
-def plot_comparison(x_data, y_data_dict, xlabel, ylabel, title, filename):
-    os.makedirs(os.path.dirname(filename), exist_ok=True)
+def run_config(config, label, progress=None, workers=1, engine=None):
+    """
+    Aggregated Monte Carlo results for one experiment config. With more than
+    one worker the trials run on run_monte_carlo_shared, except when the
+    config tracks coalitions: the shared arrays hold only wealth and
+    bankruptcy, so those configs always run serially.
+    """
+    if engine is not None:
+        config.engine = engine
+    if workers > 1 and not config.track_coalitions:
+        return run_monte_carlo_shared(config, workers, progress, label)
+    return aggregate_monte_carlo_results(run_monte_carlo(config, progress=progress, label=label))
 
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 6))
 
-    wealth_keys = list(y_data_dict['wealth'].keys())
-    for label, data in y_data_dict['wealth'].items():
-        marker = 'o' if label == wealth_keys[0] else 's'
-        ax1.plot(x_data, data, marker=marker, linewidth=2, label=label)
-
-    ax1.set_xlabel(xlabel)
-    ax1.set_ylabel('Wealth')
-    ax1.set_title(f'{title}: Wealth')
-    ax1.legend()
-    ax1.grid(alpha=0.3)
-
-    survival_keys = list(y_data_dict['survival'].keys())
-    for label, data in y_data_dict['survival'].items():
-        marker = 'o' if label == survival_keys[0] else 's'
-        ax2.plot(x_data, data, marker=marker, linewidth=2, label=label)
-
-    ax2.set_xlabel(xlabel)
-    ax2.set_ylabel('Survival Rate')
-    ax2.set_title(f'{title}: Survival')
-    ax2.legend()
-    ax2.grid(alpha=0.3)
-
-    plt.tight_layout()
-    plt.savefig(filename, dpi=300)
-    plt.close()
-
-
-
-def run_h1_experiment():
+def run_h1_experiment(render_figure=True, progress=None, workers=1, engine=None):
     print("H1: REPUTATION SIGNAL STRENGTH")
     h1_configs = create_h1_configs()
     results = {}
 
     for signal_name, config in h1_configs.items():
         print(f"\n{signal_name}: alpha_c={config.alpha_c}, alpha_d={config.alpha_d}")
-        res = run_monte_carlo(config)
-        results[signal_name] = aggregate_monte_carlo_results(res)
+        results[signal_name] = run_config(config, f'h1/{signal_name}', progress, workers, engine)
 
     print("\n" + "*" * 70)
     print("H1 SUMMARY")
@@ -73,32 +55,45 @@ def run_h1_experiment():
         }
     }
 
-    plot_comparison(alpha_cs, y_data, 'alpha_c', 'Wealth/Survival', 'H1', 'figures/h1_results.png')
-    print("\nSaved: h1_results.png")
+    figure = {
+        'kind': 'comparison',
+        'args': {'x_data': alpha_cs, 'y_data_dict': y_data, 'xlabel': 'alpha_c', 'ylabel': 'Wealth/Survival',
+                 'title': 'H1', 'filename': 'figures/h1_results.png'}
+    }
+    path = save_results('h1', results, figure)
+    print(f"\nSaved: {path}")
+    if render_figure:
+        render(path)
+        print("Saved: h1_results.png")
     return results
 
 
-def run_h2_experiment():
+def run_h2_experiment(render_figure=True, progress=None, workers=1, engine=None):
     print("H2: NETWORK THRESHOLD")
     h2_configs = create_h2_configs()
     results = {}
 
     for threshold_name, config in h2_configs.items():
         print(f"\n{threshold_name}: K={config.network_threshold}")
-        res = run_monte_carlo(config)
-        results[threshold_name] = aggregate_monte_carlo_results(res)
+        results[threshold_name] = run_config(config, f'h2/{threshold_name}', progress, workers, engine)
 
     print("\n" + "*" * 70)
     print("H2 SUMMARY")
     print("*" * 70)
-    print(f"{'Threshold':20s} {'K':>8s} {'CB Wealth':>12s} {'TFT Wealth':>12s} {'Advantage':>12s}")
+    print(f"{'Threshold':20s} {'K':>8s} {'CB Wealth':>12s} {'TFT Wealth':>12s} {'Advantage':>12s} {'CB Coalition':>13s}"
+          f" {'Coalitions':>11s} {'Largest':>8s} {'Final':>6s}")
 
     for threshold_name in results:
         config = h2_configs[threshold_name]
         cb_w = results[threshold_name]['Coalition Builder']['wealth_mean']
         tft_w = results[threshold_name]['TFT']['wealth_mean']
         adv = (cb_w - tft_w) / tft_w * 100
-        print(f"{threshold_name:20s} {config.network_threshold:>8.1f} {cb_w:>12.2f} {tft_w:>12.2f} {adv:>11.1f}%")
+        cb_c = results[threshold_name]['Coalition Builder'].get('coalition_mean', 0)
+        # per-round series, averaged over rounds then trials
+        series = results[threshold_name]['Coalition Builder']
+        print(f"{threshold_name:20s} {config.network_threshold:>8.1f} {cb_w:>12.2f} {tft_w:>12.2f} {adv:>11.1f}% {cb_c:>12.2%}"
+              f" {series.get('coalitions_mean', 0):>11.1f} {series.get('largest_mean', 0):>8.1f}"
+              f" {series.get('largest_final', 0):>6.1f}")
 
     thresholds = ['very_easy', 'easy', 'moderate', 'moderate_hard', 'hard', 'very_hard']
     Ks = [h2_configs[t].network_threshold for t in thresholds]
@@ -114,20 +109,27 @@ def run_h2_experiment():
         }
     }
 
-    plot_comparison(Ks, y_data, 'K', 'Wealth/Survival', 'H2', 'figures/h2_results.png')
-    print("\nSaved: h2_results.png")
+    figure = {
+        'kind': 'comparison',
+        'args': {'x_data': Ks, 'y_data_dict': y_data, 'xlabel': 'K', 'ylabel': 'Wealth/Survival',
+                 'title': 'H2', 'filename': 'figures/h2_results.png'}
+    }
+    path = save_results('h2', results, figure)
+    print(f"\nSaved: {path}")
+    if render_figure:
+        render(path)
+        print("Saved: h2_results.png")
     return results
 
 
-def run_h3_experiment():
+def run_h3_experiment(render_figure=True, progress=None, workers=1, engine=None):
     print("H3: NOISE EFFECT ON COOPERATION")
     h3_configs = create_h3_configs()
     results = {}
 
     for config_name, config in h3_configs.items():
         print(f"\n{config_name}: noise={config.noise}")
-        res = run_monte_carlo(config)
-        results[config_name] = aggregate_monte_carlo_results(res)
+        results[config_name] = run_config(config, f'h3/{config_name}', progress, workers, engine)
 
     print("\n" + "*" * 70)
     print("H3 SUMMARY")
@@ -160,17 +162,44 @@ def run_h3_experiment():
         }
     }
 
-    plot_comparison(noises, y_data, 'Noise Level', 'Wealth/Survival', 'H3', 'figures/h3_results.png')
-    print("\nSaved: h3_results.png")
+    figure = {
+        'kind': 'comparison',
+        'args': {'x_data': noises, 'y_data_dict': y_data, 'xlabel': 'Noise Level', 'ylabel': 'Wealth/Survival',
+                 'title': 'H3', 'filename': 'figures/h3_results.png'}
+    }
+    path = save_results('h3', results, figure)
+    print(f"\nSaved: {path}")
+    if render_figure:
+        render(path)
+        print("Saved: h3_results.png")
     return results
 
 
-def run_all_experiments():
-    h1 = run_h1_experiment()
-    h2 = run_h2_experiment()
-    h3 = run_h3_experiment()
+def run_all_experiments(metrics_path=None, workers=1, engine=None):
+    # one Progress for the whole run, so the metrics file covers every config
+    progress = Progress(metrics_path)
+    h1 = run_h1_experiment(render_figure=False, progress=progress, workers=workers, engine=engine)
+    h2 = run_h2_experiment(render_figure=False, progress=progress, workers=workers, engine=engine)
+    h3 = run_h3_experiment(render_figure=False, progress=progress, workers=workers, engine=engine)
+    for filename in render_all([os.path.join(RESULTS_DIR, f'{h}.json') for h in ('h1', 'h2', 'h3')]):
+        print(f"Saved: {filename}")
     return {'H1': h1, 'H2': h2, 'H3': h3}
 
 
 if __name__ == "__main__":
-    run_all_experiments()
+    import argparse
+    parser = argparse.ArgumentParser(description="run the H1-H3 experiments")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="print predicted wall time and peak memory instead of running")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="worker processes per config (coalition-tracking configs run serially)")
+    parser.add_argument('--engine', choices=['python', 'jit'], default=None)
+    parser.add_argument('--recalibrate', action='store_true', help="re-run the cost model benchmark first")
+    parser.add_argument('--metrics', default=None,
+                        help="metrics file rewritten during the run (.prom for Prometheus text, else JSON)")
+    args = parser.parse_args()
+    if args.dry_run:
+        from cost_model import dry_run
+        dry_run(args.workers, args.engine, recalibrate=args.recalibrate)
+    else:
+        run_all_experiments(args.metrics, args.workers, args.engine)
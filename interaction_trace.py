@@ -0,0 +1,149 @@
+#opt-in binary trace of every interaction, one fixed-width record per play_round
+#the reader memory-maps the file, so queries never copy or re-simulate
+import json
+import numpy as np
+
+
+TRACE_DTYPE = np.dtype([
+    ('round', '<u4'),
+    ('p1', '<u4'),
+    ('p2', '<u4'),
+    ('intended1', 'u1'),
+    ('intended2', 'u1'),
+    ('action1', 'u1'),
+    ('action2', 'u1'),
+    ('payoff1', '<f8'),
+    ('payoff2', '<f8'),
+])
+
+ACTION_CODE = {'D': 0, 'C': 1}
+
+
+class TraceWriter:
+    """Buffers records as tuples and flushes them with one bulk write.
+
+    The header (strategies, initial wealth, threshold) goes to <path>.json.
+    """
+    def __init__(self, path, players, config, buffer_size=65536):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.round = 0
+        self.file = open(path, 'wb')
+        header = {
+            'strategies': [p.strategy.name for p in players],
+            'initial_wealth': config.initial_wealth,
+            'wealth_threshold': config.wealth_threshold,
+        }
+        with open(path + '.json', 'w') as f:
+            json.dump(header, f)
+
+    def record(self, p1, p2, intended1, intended2, a1, a2, payoff1, payoff2):
+        self.buffer.append((self.round, p1.id, p2.id,
+                            ACTION_CODE[intended1], ACTION_CODE[intended2],
+                            ACTION_CODE[a1], ACTION_CODE[a2],
+                            payoff1, payoff2))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            np.array(self.buffer, dtype=TRACE_DTYPE).tofile(self.file)
+            self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class TraceReader:
+    """
+    >>> import os, tempfile
+    >>> from config import GameConfig
+    >>> from simulation import run_simulation, analyze_trial
+    >>> path = os.path.join(tempfile.mkdtemp(), 'trial.bin')
+    >>> config = GameConfig(num_rounds=50, player_counts={'TFT': 4, 'AllD': 4})
+    >>> players = run_simulation(config, trace_path=path)
+    >>> trace = TraceReader(path)
+    >>> trace.analyze() == analyze_trial(players)
+    True
+    >>> rates = trace.cooperation_rate(rounds=(0, 10))
+    >>> rates[('AllD', 'TFT')] <= 0.5
+    True
+
+    Fractional payoffs are summed in the engine's order, so wealth matches exactly:
+
+    >>> config.payoff = {('C', 'C'): (1.1, 1.1), ('C', 'D'): (-0.3, 1.7),
+    ...                  ('D', 'C'): (1.7, -0.3), ('D', 'D'): (0.1, 0.1)}
+    >>> players = run_simulation(config, trace_path=path + '.fractional')
+    >>> TraceReader(path + '.fractional').analyze() == analyze_trial(players)
+    True
+    """
+    def __init__(self, path):
+        with open(path + '.json') as f:
+            header = json.load(f)
+        self.strategies = header['strategies']
+        self.initial_wealth = header['initial_wealth']
+        self.wealth_threshold = header['wealth_threshold']
+        self.names = list(dict.fromkeys(self.strategies))
+        self.codes = np.array([self.names.index(s) for s in self.strategies], dtype=np.int64)
+        self.records = np.memmap(path, dtype=TRACE_DTYPE, mode='r') if _size(path) else np.zeros(0, TRACE_DTYPE)
+
+    def window(self, rounds=None):
+        if rounds is None:
+            return self.records
+        start, stop = np.searchsorted(self.records['round'], rounds)
+        return self.records[start:stop]
+
+    def cooperation_rate(self, rounds=None, noisy=True):
+        """Share of C played by the row strategy against the column strategy."""
+        rec = self.window(rounds)
+        a1, a2 = ('action1', 'action2') if noisy else ('intended1', 'intended2')
+        me = np.concatenate([self.codes[rec['p1']], self.codes[rec['p2']]])
+        opp = np.concatenate([self.codes[rec['p2']], self.codes[rec['p1']]])
+        coop = np.concatenate([rec[a1], rec[a2]])
+        k = len(self.names)
+        idx = me * k + opp
+        played = np.bincount(idx, minlength=k * k)
+        cooperated = np.bincount(idx, weights=coop, minlength=k * k)
+        return {
+            (self.names[i // k], self.names[i % k]): cooperated[i] / played[i]
+            for i in np.nonzero(played)[0]
+        }
+
+    def final_wealth(self):
+        # replay the payoffs in record order, as play_round added them, so
+        # fractional payoffs round exactly as they did in the engine
+        wealth = np.full(len(self.strategies), float(self.initial_wealth))
+        rec = self.records
+        players = np.column_stack([rec['p1'], rec['p2']]).ravel()
+        payoffs = np.column_stack([rec['payoff1'], rec['payoff2']]).ravel()
+        np.add.at(wealth, players.astype(np.int64), payoffs)
+        return wealth
+
+    def analyze(self):
+        """Same output as simulation.analyze_trial, rebuilt from the trace.
+
+        Bankrupt players never play again, so bankrupt == final wealth below threshold.
+        """
+        wealth = self.final_wealth()
+        by_strategy = {}
+        for name, w in zip(self.strategies, wealth.tolist()):
+            if name not in by_strategy:
+                by_strategy[name] = {'total': 0, 'survived': 0, 'total_wealth': 0.0, 'final_wealth': []}
+            data = by_strategy[name]
+            data['total'] += 1
+            if w >= self.wealth_threshold:
+                data['survived'] += 1
+            data['total_wealth'] += w
+            data['final_wealth'].append(w)
+        for data in by_strategy.values():
+            data['survival_rate'] = data['survived'] / data['total']
+            data['avg_wealth'] = data['total_wealth'] / data['total']
+        return by_strategy
+
+
+def _size(path):
+    with open(path, 'rb') as f:
+        f.seek(0, 2)
+        return f.tell()
@@ -0,0 +1,256 @@
+#whole-trial round loop over array state, JIT-compiled with numba when it is installed
+#covers the fully mixed model: random pairing, the 8 built-in strategies, noise,
+#payoffs, reputation, network weights and bankruptcy (no topology/matching/trace/coalitions)
+import numpy as np
+from player import STRATEGY_MAP
+from rng import RandomStream
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda f: f
+
+
+#strategy codes; spelled out here rather than taken from STRATEGY_MAP order, since
+#cache=True freezes these globals into the compiled kernels and only invalidates
+#the cache when this file changes
+STRATEGY_KEYS = ('AllC', 'AllD', 'TFT', 'GTFT', 'GRIM', 'RAND', 'ReputationAwareTFT', 'CoalitionBuilder')
+ALLC, ALLD, TFT, GTFT, GRIM, RAND, RATFT, CB = range(len(STRATEGY_KEYS))
+
+#layout of the float parameter vector handed to the kernel
+(NOISE, GTFT_P, REP_THRESHOLD, HIGH_REP, K, ALPHA_C, ALPHA_D,
+ REP_MAX, REP_MIN, GAMMA, DELTA, WEALTH_THRESHOLD) = range(12)
+
+#ReputationAwareTFT builds its GTFT with a fixed forgiveness
+RATFT_FORGIVENESS = 0.1
+
+
+def supports(config):
+    """True when the kernel models everything this config switches on.
+
+    >>> from config import GameConfig
+    >>> supports(GameConfig()), supports(GameConfig(topology='ring'))
+    (True, False)
+    >>> set(STRATEGY_KEYS) <= set(STRATEGY_MAP)
+    True
+    """
+    return (config.topology is None and config.matching == 'random'
+            and not config.track_coalitions
+            and all(key in STRATEGY_KEYS for key in config.player_counts))
+
+
+class KernelStream(RandomStream):
+    """RandomStream whose shuffle is the kernel's Fisher-Yates over the same uniforms,
+    so the object engine and the kernel consume one identical sequence of draws."""
+    def shuffle(self, x):
+        for i in range(len(x) - 1, 0, -1):
+            j = min(int(self.random() * (i + 1)), i)
+            x[i], x[j] = x[j], x[i]
+
+
+@njit(cache=True)
+def _intended(code, i, j, last, ever_d, weights, reputation, params, uniforms, cursor):
+    # returns (action, cursor) with 0 = C, 1 = D; last[i, j] is -1 before the first game
+    gtft_p = params[GTFT_P]
+    if code == ALLC:
+        return 0, cursor
+    if code == ALLD:
+        return 1, cursor
+    if code == GRIM:
+        return 1 if ever_d[i, j] else 0, cursor
+    if code == RAND:
+        return 0 if uniforms[cursor] < 0.5 else 1, cursor + 1
+    if code == RATFT:
+        if reputation[j] > params[HIGH_REP]:
+            code = GTFT
+            gtft_p = RATFT_FORGIVENESS
+        elif reputation[j] < params[REP_THRESHOLD]:
+            return 1, cursor
+        else:
+            code = TFT
+    if code == CB:
+        if weights[i, j] >= params[K]:
+            return 0, cursor
+        code = TFT
+    prev = int(last[i, j])
+    if prev < 0:
+        return 0, cursor
+    if code == GTFT and prev == 1:
+        cursor += 1
+        if uniforms[cursor - 1] < gtft_p:
+            return 0, cursor
+    return prev, cursor
+
+
+@njit(cache=True)
+def _reputation_step(rep, action, params):
+    rep += params[ALPHA_C] if action == 0 else -params[ALPHA_D]
+    return max(params[REP_MIN], min(params[REP_MAX], rep))
+
+
+@njit(cache=True)
+def run_rounds(codes, wealth, reputation, bankrupt, weights, last, ever_d,
+               payoff, params, start, stop, uniforms, cursor):
+    """
+    Play rounds [start, stop) in place. Returns (next round, cursor); the
+    round comes back early when fewer uniforms are left than a round can use,
+    so the caller refills the buffer and calls again.
+    """
+    n = len(codes)
+    order = np.empty(n, dtype=np.int64)
+    for r in range(start, stop):
+        m = 0
+        for k in range(n):
+            if not bankrupt[k]:
+                order[m] = k
+                m += 1
+        if m < 2:
+            return stop, cursor
+        # shuffle uses m - 1 draws, each game at most 4
+        if cursor + 3 * m > len(uniforms):
+            return r, cursor
+        for k in range(m - 1, 0, -1):
+            s = int(uniforms[cursor] * (k + 1))
+            cursor += 1
+            if s > k:
+                s = k
+            tmp = order[k]
+            order[k] = order[s]
+            order[s] = tmp
+        for k in range(0, m - 1, 2):
+            i = order[k]
+            j = order[k + 1]
+            a1, cursor = _intended(codes[i], i, j, last, ever_d, weights, reputation, params, uniforms, cursor)
+            if uniforms[cursor] < params[NOISE]:
+                a1 = 1 - a1
+            cursor += 1
+            a2, cursor = _intended(codes[j], j, i, last, ever_d, weights, reputation, params, uniforms, cursor)
+            if uniforms[cursor] < params[NOISE]:
+                a2 = 1 - a2
+            cursor += 1
+
+            last[i, j] = a2
+            last[j, i] = a1
+            if a2 == 1:
+                ever_d[i, j] = True
+            if a1 == 1:
+                ever_d[j, i] = True
+
+            wealth[i] += payoff[a1, a2, 0]
+            wealth[j] += payoff[a1, a2, 1]
+
+            reputation[i] = _reputation_step(reputation[i], a1, params)
+            reputation[j] = _reputation_step(reputation[j], a2, params)
+
+            if a1 == 0 and a2 == 0:
+                w = weights[i, j] + params[GAMMA]
+            else:
+                w = max(0.0, weights[i, j] - params[DELTA])
+            weights[i, j] = w
+            weights[j, i] = w
+
+            if wealth[i] < params[WEALTH_THRESHOLD]:
+                bankrupt[i] = True
+            if wealth[j] < params[WEALTH_THRESHOLD]:
+                bankrupt[j] = True
+    return stop, cursor
+
+
+def _params(config):
+    params = np.zeros(12)
+    params[NOISE] = config.noise
+    params[GTFT_P] = config.gtft_forgiveness
+    params[REP_THRESHOLD] = config.reputation_threshold
+    params[HIGH_REP] = config.ratft_high_rep_threshold
+    params[K] = config.network_threshold
+    params[ALPHA_C] = config.alpha_c
+    params[ALPHA_D] = config.alpha_d
+    params[REP_MAX] = config.reputation_max
+    params[REP_MIN] = config.reputation_min
+    params[GAMMA] = config.gamma
+    params[DELTA] = config.delta
+    params[WEALTH_THRESHOLD] = config.wealth_threshold
+    return params
+
+
+def run_trial(config, seed=None, block_size=65536):
+    """
+    One trial on the kernel; returns the final array state. The uniforms are
+    the same blocks a KernelStream(seed, block_size) hands out one at a time.
+
+    >>> from config import GameConfig
+    >>> state = run_trial(GameConfig(num_rounds=50, player_counts={'TFT': 3, 'AllD': 3}), seed=1)
+    >>> state['wealth'].shape, state['bankrupt'].dtype
+    ((6,), dtype('bool'))
+    """
+    codes = np.array([STRATEGY_KEYS.index(key)
+                      for key, count in config.player_counts.items() for _ in range(count)],
+                     dtype=np.int64)
+    n = len(codes)
+    state = {
+        'wealth': np.full(n, float(config.initial_wealth)),
+        'reputation': np.zeros(n),
+        'bankrupt': np.zeros(n, dtype=np.bool_),
+        'weights': np.zeros((n, n)),
+        'last': np.full((n, n), -1, dtype=np.int8),
+        'ever_d': np.zeros((n, n), dtype=np.bool_),
+    }
+    payoff = np.zeros((2, 2, 2))
+    for (a1, a2), values in config.payoff.items():
+        payoff['CD'.index(a1), 'CD'.index(a2)] = values
+    params = _params(config)
+
+    generator = np.random.default_rng(seed)
+    uniforms = generator.random(block_size)
+    cursor = 0
+    round_num = 0
+    while round_num < config.num_rounds:
+        round_num, cursor = run_rounds(codes, state['wealth'], state['reputation'], state['bankrupt'],
+                                       state['weights'], state['last'], state['ever_d'],
+                                       payoff, params, round_num, config.num_rounds, uniforms, cursor)
+        if round_num < config.num_rounds:
+            uniforms = np.concatenate([uniforms[cursor:], generator.random(block_size)])
+            cursor = 0
+    state['codes'] = codes
+    return state
+
+
+def engines_agree(config, seed=0):
+    """
+    Parity check: the kernel against the object engine (PlayerWrapper +
+    play_round) driven by a KernelStream with the same seed. Wealth,
+    reputation, bankruptcy and every network weight must match exactly.
+
+    >>> from config import GameConfig
+    >>> engines_agree(GameConfig(num_rounds=300, fast_forward=False))
+    True
+    >>> engines_agree(GameConfig(num_rounds=300, noise=0.0, fast_forward=False), seed=1)
+    True
+    >>> engines_agree(GameConfig(num_rounds=300, noise=0.2, gtft_forgiveness=0.5,
+    ...                          alpha_c=0.05, alpha_d=0.1, fast_forward=False), seed=2)
+    True
+    >>> engines_agree(GameConfig(num_rounds=300, network_threshold=1.0, initial_wealth=5.0,
+    ...                          player_counts={'AllD': 6, 'CoalitionBuilder': 5, 'RAND': 4},
+    ...                          fast_forward=False), seed=3)
+    True
+    """
+    from simulation import run_simulation
+
+    block_size = 4096
+    players = run_simulation(config, rng=KernelStream(seed, block_size))
+    state = run_trial(config, seed, block_size)
+    for p in players:
+        weights = np.zeros(len(players))
+        for opp_id, w in p.weights.items():
+            weights[opp_id] = w
+        if (p.wealth != state['wealth'][p.id] or p.reputation != state['reputation'][p.id]
+                or p.bankrupt != state['bankrupt'][p.id]
+                or not np.array_equal(weights, state['weights'][p.id])):
+            return False
+    return True
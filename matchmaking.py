@@ -0,0 +1,292 @@
+#partner choice: active players pick partners by reputation and network trust
+#Fenwick trees hold the reputation scores and each player's trust weights,
+#so draws and updates are O(log n) and a round is O(n log n) even with dense trust
+import math
+import random
+
+
+class FenwickTree:
+    """Cumulative-sum tree over non-negative scores.
+
+    >>> tree = FenwickTree(4)
+    >>> for i, s in enumerate([1.0, 0.0, 2.0, 1.0]):
+    ...     tree.set(i, s)
+    >>> tree.total()
+    4.0
+    >>> [tree.find(u) for u in (0.5, 1.5, 2.9, 3.5)]
+    [0, 2, 2, 3]
+    >>> tree.set(2, 0.0)
+    >>> tree.find(1.5), tree.total()
+    (3, 2.0)
+    """
+    def __init__(self, n):
+        self.n = n
+        self.tree = [0.0] * (n + 1)
+        self.values = [0.0] * n
+        self.step = 1 << max(0, n.bit_length() - 1) if n else 0
+
+    def resize(self, n):
+        """Grow to n entries; the new ones start at 0."""
+        self.n = n
+        self.step = 1 << max(0, n.bit_length() - 1) if n else 0
+        self.rebuild(self.values + [0.0] * (n - len(self.values)))
+
+    def rebuild(self, values):
+        """O(n) reconstruction, also clears float drift from many point updates."""
+        self.values = list(values)
+        tree = [0.0] + self.values
+        for i in range(1, self.n + 1):
+            parent = i + (i & -i)
+            if parent <= self.n:
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def set(self, i, value):
+        delta = value - self.values[i]
+        if delta == 0:
+            return
+        self.values[i] = value
+        i += 1
+        tree, n = self.tree, self.n
+        while i <= n:
+            tree[i] += delta
+            i += i & -i
+
+    def total(self):
+        s, i, tree = 0.0, self.n, self.tree
+        while i > 0:
+            s += tree[i]
+            i -= i & -i
+        return s
+
+    def find(self, u):
+        """Index whose cumulative range contains u, for 0 <= u < total()."""
+        pos, step, tree, n = 0, self.step, self.tree, self.n
+        while step:
+            nxt = pos + step
+            if nxt <= n and tree[nxt] <= u:
+                pos = nxt
+                u -= tree[nxt]
+            step >>= 1
+        return min(pos, n - 1)
+
+
+class TrustWeights:
+    """
+    Dict-like view of one player's network weights, as update_network uses
+    them, that also keeps a Fenwick tree of the weights for sampling.
+    A partner that went bankrupt keeps its weight but loses its sampling mass.
+
+    >>> w = TrustWeights()
+    >>> w[3] = w.get(3, 0) + 2.0
+    >>> w[7] = 1.0
+    >>> w[3], w.get(5, 0), sorted(w.items()), w.total()
+    (2.0, 0, [(3, 2.0), (7, 1.0)], 3.0)
+    >>> w.sample(0.5), w.sample(2.5)
+    (3, 7)
+    >>> w.exclude(3)
+    >>> w[3], w.total(), w.sample(0.5)
+    (2.0, 1.0, 7)
+    """
+    def __init__(self, items=()):
+        self.slot = {}
+        self.ids = []
+        self.weights = []
+        self.excluded = set()
+        self.tree = FenwickTree(0)
+        for opp_id, w in dict(items).items():
+            self.slot[opp_id] = len(self.ids)
+            self.ids.append(opp_id)
+            self.weights.append(w)
+        if self.ids:
+            self.tree.resize(len(self.ids))
+            self.tree.rebuild(self.weights)
+
+    def get(self, opp_id, default=None):
+        k = self.slot.get(opp_id)
+        return default if k is None else self.weights[k]
+
+    def __getitem__(self, opp_id):
+        return self.weights[self.slot[opp_id]]
+
+    def __setitem__(self, opp_id, value):
+        k = self.slot.get(opp_id)
+        if k is None:
+            k = self.slot[opp_id] = len(self.ids)
+            self.ids.append(opp_id)
+            self.weights.append(0.0)
+            if k >= self.tree.n:
+                # doubling keeps appends amortized O(log n)
+                self.tree.resize(max(4, 2 * self.tree.n))
+        self.weights[k] = value
+        if opp_id not in self.excluded:
+            self.tree.set(k, value)
+
+    def __contains__(self, opp_id):
+        return opp_id in self.slot
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def items(self):
+        return list(zip(self.ids, self.weights))
+
+    def exclude(self, opp_id):
+        k = self.slot.get(opp_id)
+        self.excluded.add(opp_id)
+        if k is not None:
+            self.tree.set(k, 0.0)
+
+    def total(self):
+        return self.tree.total()
+
+    def sample(self, u):
+        """Partner whose cumulative weight range contains u (None on float drift past the end)."""
+        k = self.tree.find(u)
+        if k >= len(self.ids) or self.tree.values[k] <= 0:
+            return None
+        return self.ids[k]
+
+
+class PartnerChoiceMatcher:
+    """
+    Each active player, in random order, draws a partner j with probability
+    proportional to exp(reputation_bias * r_j) + trust_bias * w(i, j).
+
+    Already matched and bankrupt players are removed from the reputation tree
+    for the round, so pairs stay disjoint as in random_pairing. A trust draw
+    that lands on a taken partner is rejected and redrawn; after max_tries
+    rejections the player draws from the reputation tree alone, so it sits
+    out only when nobody is left. Player weights become TrustWeights views.
+
+    >>> from simulation import PlayerWrapper
+    >>> from player import AllC
+    >>> players = [PlayerWrapper(i, AllC) for i in range(5)]
+    >>> players[4].bankrupt = True
+    >>> matcher = PartnerChoiceMatcher(len(players))
+    >>> pairs = matcher.pairing(players)
+    >>> len(pairs)
+    2
+    >>> sorted(p.id for pair in pairs for p in pair)
+    [0, 1, 2, 3]
+
+    A round costs O(n log n) whatever the trust density: each player makes
+    about one O(log n) tree draw (drawers paired earlier make none, rejected
+    trust draws add a few), and no draw scans the weights.
+
+    >>> [round(draws_per_player(n, degree), 1) for n, degree in [(1000, 10), (1000, 999), (4000, 200)]]
+    [0.6, 1.1, 0.7]
+    """
+    def __init__(self, n, reputation_bias=2.0, trust_bias=1.0, max_tries=8,
+                 rebuild_every=100, rng=None):
+        self.tree = FenwickTree(n)
+        self.reputation_bias = reputation_bias
+        self.trust_bias = trust_bias
+        self.max_tries = max_tries
+        self.rebuild_every = rebuild_every
+        self.rounds = 0
+        self.rng = rng or random
+        self.gone = bytearray(n)
+        # O(log n) tree draws made so far, rejected ones included
+        self.draws = 0
+
+    def score(self, player):
+        if player.bankrupt:
+            return 0.0
+        return math.exp(self.reputation_bias * player.reputation)
+
+    def refresh(self, players):
+        for p in players:
+            if not isinstance(p.weights, TrustWeights):
+                p.weights = TrustWeights(p.weights.items())
+        for p in players:
+            if p.bankrupt and not self.gone[p.id]:
+                # weights are symmetric, so p's partners are exactly p's own keys
+                self.gone[p.id] = 1
+                for opp_id in p.weights:
+                    players[opp_id].weights.exclude(p.id)
+        if self.rounds % self.rebuild_every == 0:
+            self.tree.rebuild([self.score(p) for p in players])
+        else:
+            # only entries whose score actually moved touch the tree
+            for p in players:
+                self.tree.set(p.id, self.score(p))
+        self.rounds += 1
+
+    def _valid(self, j, player, players, matched):
+        return j is not None and j != player.id and not matched[j] and not players[j].bankrupt
+
+    def _draw(self, player, players, matched):
+        tree = self.tree
+        trust = player.weights
+        trust_total = self.trust_bias * trust.total() if self.trust_bias > 0 else 0.0
+        if trust_total < 1e-9:
+            trust_total = 0.0
+
+        for _ in range(self.max_tries):
+            global_total = max(0.0, tree.total())
+            if global_total + trust_total <= 0:
+                return None
+            u = self.rng.random() * (global_total + trust_total)
+            self.draws += 1
+            if u < global_total:
+                j = tree.find(u)
+            else:
+                j = trust.sample((u - global_total) / self.trust_bias)
+            if self._valid(j, player, players, matched):
+                return j
+
+        # the trust mass keeps landing on taken partners; the reputation
+        # tree only holds unmatched survivors
+        global_total = tree.total()
+        if global_total > 0:
+            self.draws += 1
+            j = tree.find(self.rng.random() * global_total)
+            if self._valid(j, player, players, matched):
+                return j
+        return None
+
+    def pairing(self, players):
+        self.refresh(players)
+        order = [p for p in players if not p.bankrupt]
+        self.rng.shuffle(order)
+        matched = bytearray(len(players))
+        removed = []
+        pairs = []
+        for p in order:
+            if matched[p.id]:
+                continue
+            # a player cannot draw itself, so take it out before drawing
+            self.tree.set(p.id, 0.0)
+            j = self._draw(p, players, matched)
+            if j is None:
+                # still available to later drawers
+                self.tree.set(p.id, self.score(p))
+                continue
+            matched[p.id] = matched[j] = 1
+            removed += (p.id, j)
+            self.tree.set(j, 0.0)
+            pairs.append((p, players[j]))
+        for i in removed:
+            self.tree.set(i, self.score(players[i]))
+        return pairs
+
+
+def draws_per_player(n, degree, seed=0):
+    """Tree draws per active player in one partner-choice round of n players
+    who each trust `degree` others."""
+    from simulation import PlayerWrapper
+    from player import AllC
+    from rng import RandomStream
+    rng = RandomStream(seed)
+    players = [PlayerWrapper(i, AllC) for i in range(n)]
+    for p in players:
+        p.reputation = rng.random() * 2 - 1
+        partners = {(p.id + 1 + k * (n - 1) // degree) % n for k in range(degree)}
+        p.weights = TrustWeights((j, 1.0 + rng.random()) for j in partners)
+    matcher = PartnerChoiceMatcher(n, rng=rng)
+    matcher.pairing(players)
+    return matcher.draws / n
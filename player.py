@@ -52,12 +52,13 @@ class GTFT:
     True
     """
     name = "GTFT"
-    def __init__(self, p):
+    def __init__(self, p, rng=None):
         self.p = p
+        self.rng = rng or random
     def strategy(self, opponent):
         if not opponent.history:
             return "C"
-        if opponent.history[-1] == "D" and random.random() < self.p:
+        if opponent.history[-1] == "D" and self.rng.random() < self.p:
             return "C"
         return opponent.history[-1]
 
@@ -89,11 +90,16 @@ class GRIM:
         return "D" if self.triggered[opp_id] else "C"
 
 class RAND:
-    """Random strategy"""
+    """Random strategy
+    >>> from rng import RandomStream
+    >>> RAND(RandomStream(1)).strategy(OpponentView([])) in ['C', 'D']
+    True
+    """
     name = "Random"
+    def __init__(self, rng=None):
+        self.rng = rng or random
     def strategy(self, opponent):
-        import random
-        return "C" if random.random() < 0.5 else "D"
+        return "C" if self.rng.random() < 0.5 else "D"
 
 class ReputationAwareTFT:
     """
@@ -121,11 +127,11 @@ class ReputationAwareTFT:
     """
     name = "Reputation Aware TFT"
 
-    def __init__(self, reputation_threshold, high_rep_threshold):
+    def __init__(self, reputation_threshold, high_rep_threshold, rng=None):
         self.reputation_threshold = reputation_threshold
         self.high_rep_threshold = high_rep_threshold
         self.tft = TFT()
-        self.gtft = GTFT(p=0.1)
+        self.gtft = GTFT(p=0.1, rng=rng)
 
     def strategy(self, opponent):
         opp_reputation = getattr(opponent, '_reputation', 0.0)
@@ -0,0 +1,175 @@
+#live progress for long runs: trials done, rounds/s, ETA, worker utilization, memory
+#runners report once per finished trial; the terminal line and the metrics file
+#are rewritten at most every `interval` seconds, never from inside the round loop
+import json
+import os
+import sys
+import time
+from cache import write_atomic
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        # no procfs: fall back to the peak, the closest portable number
+        return _peak_rss_bytes()
+
+
+def _peak_rss_bytes():
+    if resource is None:
+        return 0
+    # ru_maxrss is in KiB on Linux; children covers pool workers that have exited
+    return 1024 * (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                   + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def _format_eta(seconds):
+    if seconds is None:
+        return '--'
+    seconds = int(seconds)
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+
+
+class Progress:
+    """
+    Per-config counters plus the two outputs. metrics_path ending in .prom
+    gets Prometheus text format, anything else JSON; stream=None turns the
+    terminal line off.
+
+    >>> import json, os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'metrics.json')
+    >>> now = [0.0]
+    >>> progress = Progress(metrics_path=path, stream=None, clock=lambda: now[0])
+    >>> progress.start('h1/no_rep', trials=4, rounds=1000, workers=2)
+    >>> for _ in range(3):
+    ...     progress.trial_done('h1/no_rep', seconds=1.5)
+    >>> now[0] = 3.0
+    >>> stats = progress.stats('h1/no_rep')
+    >>> stats['trials_completed'], stats['rounds_per_second'], stats['eta_seconds']
+    (3, 1000.0, 1.0)
+    >>> stats['worker_utilization']
+    0.75
+    >>> progress.finish('h1/no_rep')
+    >>> json.load(open(path))['configs']['h1/no_rep']['trials_completed']
+    3
+    """
+    def __init__(self, metrics_path=None, stream=sys.stderr, interval=2.0, clock=time.monotonic):
+        self.metrics_path = metrics_path
+        self.stream = stream
+        self.interval = interval
+        self.clock = clock
+        self.configs = {}
+        self.current = None
+        self.last_flush = None
+        self.width = 0
+        # redraw one line in a terminal, append lines when logging to a file
+        self.redraw = stream is not None and stream.isatty()
+
+    def start(self, label, trials, rounds, workers=1):
+        self.configs[label] = {
+            'trials_total': trials, 'rounds': rounds, 'workers': workers,
+            'trials_completed': 0, 'rounds_completed': 0, 'busy_seconds': 0.0,
+            'started': self.clock(), 'finished': None, 'peak_rss_bytes': _rss_bytes(),
+        }
+        self.current = label
+        self.flush()
+
+    def trial_done(self, label, seconds, n=1, rounds=None):
+        """n trials of `label` finished, having kept a worker busy for `seconds` in total.
+        `rounds` is how many rounds they actually simulated (fast-forwarded and
+        cached trials play fewer); n full trials when not given."""
+        c = self.configs[label]
+        c['trials_completed'] += n
+        c['rounds_completed'] += rounds if rounds is not None else n * c['rounds']
+        c['busy_seconds'] += seconds
+        now = self.clock()
+        if self.last_flush is None or now - self.last_flush >= self.interval:
+            self.flush(now)
+
+    def finish(self, label):
+        self.configs[label]['finished'] = self.clock()
+        self.flush()
+        if self.redraw:
+            self.stream.write('\n')
+            self.stream.flush()
+
+    def stats(self, label, now=None):
+        c = self.configs[label]
+        end = c['finished'] if c['finished'] is not None else (now if now is not None else self.clock())
+        elapsed = max(end - c['started'], 1e-9)
+        done = c['trials_completed']
+        remaining = c['trials_total'] - done
+        return {
+            'trials_completed': done,
+            'trials_total': c['trials_total'],
+            'rounds_per_second': c['rounds_completed'] / elapsed,
+            'eta_seconds': remaining * elapsed / done if done else None,
+            'worker_utilization': min(1.0, c['busy_seconds'] / (c['workers'] * elapsed)),
+            'peak_rss_bytes': c['peak_rss_bytes'],
+        }
+
+    def flush(self, now=None):
+        now = self.clock() if now is None else now
+        self.last_flush = now
+        if self.current is not None:
+            c = self.configs[self.current]
+            c['peak_rss_bytes'] = max(c['peak_rss_bytes'], _rss_bytes())
+        if self.stream is not None and self.current is not None:
+            line = self.line(self.current, now)
+            self.stream.write('\r' + line.ljust(self.width) if self.redraw else line + '\n')
+            self.stream.flush()
+            self.width = len(line)
+        if self.metrics_path is not None:
+            self.write_metrics(now)
+
+    def line(self, label, now=None):
+        s = self.stats(label, now)
+        return (f"{label}: {s['trials_completed']}/{s['trials_total']} trials  "
+                f"{s['rounds_per_second']:,.0f} rounds/s  ETA {_format_eta(s['eta_seconds'])}  "
+                f"util {s['worker_utilization']:.0%}  mem {s['peak_rss_bytes'] / 2 ** 20:.0f}MB")
+
+    def write_metrics(self, now=None):
+        configs = {label: self.stats(label, now) for label in self.configs}
+        if self.metrics_path.endswith('.prom'):
+            text = prometheus_text(configs)
+        else:
+            text = json.dumps({'updated': time.time(), 'configs': configs}, indent=2)
+        write_atomic(self.metrics_path, text)
+
+
+METRICS = (
+    ('trials_completed', 'gauge', 'Trials finished for the config'),
+    ('trials_total', 'gauge', 'Trials planned for the config'),
+    ('rounds_per_second', 'gauge', 'Simulated rounds per wall-clock second'),
+    ('eta_seconds', 'gauge', 'Estimated seconds until the config is done'),
+    ('worker_utilization', 'gauge', 'Busy worker time / (workers * elapsed)'),
+    ('peak_rss_bytes', 'gauge', 'Peak resident memory of the reporting process during the config'),
+)
+
+
+def prometheus_text(configs):
+    """
+    >>> print(prometheus_text({'h3/noise_00': {'trials_completed': 5, 'eta_seconds': None}}), end='')
+    # HELP ipd_trials_completed Trials finished for the config
+    # TYPE ipd_trials_completed gauge
+    ipd_trials_completed{config="h3/noise_00"} 5
+    """
+    lines = []
+    for name, kind, help_text in METRICS:
+        samples = [(label, stats[name]) for label, stats in configs.items()
+                   if stats.get(name) is not None]
+        if not samples:
+            continue
+        lines.append(f"# HELP ipd_{name} {help_text}")
+        lines.append(f"# TYPE ipd_{name} {kind}")
+        lines += [f'ipd_{name}{{config="{label}"}} {value}' for label, value in samples]
+    return '\n'.join(lines) + '\n'
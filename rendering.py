@@ -0,0 +1,158 @@
+#figure rendering, kept apart from the simulation so workers never import matplotlib
+#experiments/validation save results to json first; this stage turns them into figures
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+
+RESULTS_DIR = 'results'
+
+
+def _to_builtin(obj):
+    """numpy scalars/arrays -> plain python so results can go to json.
+
+    >>> import numpy as np
+    >>> _to_builtin({'a': np.float64(1.5), 'b': np.arange(2)})
+    {'a': 1.5, 'b': [0, 1]}
+    """
+    if isinstance(obj, dict):
+        return {k: _to_builtin(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_to_builtin(v) for v in obj]
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    return obj
+
+
+def save_results(name, results, figure):
+    """Write results plus the figure spec to results/<name>.json and return the path."""
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f'{name}.json')
+    with open(path, 'w') as f:
+        json.dump(_to_builtin({'results': results, 'figure': figure}), f, indent=1)
+    return path
+
+
+def plot_comparison(x_data, y_data_dict, xlabel, ylabel, title, filename):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 6))
+
+    wealth_keys = list(y_data_dict['wealth'].keys())
+    for label, data in y_data_dict['wealth'].items():
+        marker = 'o' if label == wealth_keys[0] else 's'
+        ax1.plot(x_data, data, marker=marker, linewidth=2, label=label)
+
+    ax1.set_xlabel(xlabel)
+    ax1.set_ylabel('Wealth')
+    ax1.set_title(f'{title}: Wealth')
+    ax1.legend()
+    ax1.grid(alpha=0.3)
+
+    survival_keys = list(y_data_dict['survival'].keys())
+    for label, data in y_data_dict['survival'].items():
+        marker = 'o' if label == survival_keys[0] else 's'
+        ax2.plot(x_data, data, marker=marker, linewidth=2, label=label)
+
+    ax2.set_xlabel(xlabel)
+    ax2.set_ylabel('Survival Rate')
+    ax2.set_title(f'{title}: Survival')
+    ax2.legend()
+    ax2.grid(alpha=0.3)
+
+    plt.tight_layout()
+    plt.savefig(filename, dpi=300)
+    plt.close()
+
+
+def plot_convergence(data, strategies, filename='figures/convergence.png'):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 10))
+
+    for s in strategies:
+        n = len(data[s]['wealth'])
+        ax1.plot(range(1, n + 1), data[s]['wealth'], linewidth=2, label=s)
+        ax2.plot(range(1, n + 1), data[s]['survival'], linewidth=2, label=s)
+
+    ax1.set_title("Wealth Convergence", fontsize=14)
+    ax1.set_xlabel("Number of Runs")
+    ax1.set_ylabel("Cumulative Average Wealth")
+    ax1.legend()
+    ax1.grid(alpha=0.3)
+
+    ax2.set_title("Survival Rate Convergence", fontsize=14)
+    ax2.set_xlabel("Number of Runs")
+    ax2.set_ylabel("Cumulative Average Survival Rate")
+    ax2.legend()
+    ax2.grid(alpha=0.3)
+
+    plt.tight_layout()
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    plt.savefig(filename, dpi=300)
+    plt.close()
+
+
+PLOTTERS = {
+    'comparison': plot_comparison,
+    'convergence': plot_convergence,
+}
+
+
+def render(path):
+    """Render the figure described in a saved results file, return the figure path."""
+    with open(path) as f:
+        figure = json.load(f)['figure']
+    PLOTTERS[figure['kind']](**figure['args'])
+    return figure['args']['filename']
+
+
+def render_all(paths, workers=None):
+    """Render several results files, one process per figure when there is more than one."""
+    paths = list(paths)
+    if len(paths) <= 1:
+        return [render(p) for p in paths]
+    with ProcessPoolExecutor(max_workers=workers or min(len(paths), os.cpu_count() or 1)) as pool:
+        return list(pool.map(render, paths))
+
+
+def figure_paths(directory=RESULTS_DIR):
+    """
+    Saved results files in `directory` that describe a figure. Other JSON kept
+    there (the cost model, metrics files) has no 'figure' key and is skipped.
+
+    >>> import tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> with open(os.path.join(directory, 'h1.json'), 'w') as f:
+    ...     json.dump({'results': {}, 'figure': {'kind': 'comparison', 'args': {}}}, f)
+    >>> with open(os.path.join(directory, 'metrics.json'), 'w') as f:
+    ...     json.dump({'configs': {}}, f)
+    >>> [os.path.basename(p) for p in figure_paths(directory)]
+    ['h1.json']
+    """
+    paths = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not name.endswith('.json') or not os.path.isfile(path):
+            continue
+        with open(path) as f:
+            try:
+                saved = json.load(f)
+            except ValueError:
+                continue
+        if isinstance(saved, dict) and 'figure' in saved:
+            paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    targets = sys.argv[1:] or figure_paths()
+    for filename in render_all(targets):
+        print(f"Saved: {filename}")
@@ -0,0 +1,163 @@
+#trials x players result arrays in shared memory: workers write their own row,
+#the parent aggregates with numpy reductions, nothing is pickled per trial
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from player import STRATEGY_MAP
+from simulation import run_simulation, rounds_played
+from progress import Progress
+
+
+FIELDS = (
+    ('wealth', np.float64),
+    ('reputation', np.float64),
+    ('bankrupt', np.bool_),
+    ('strategy', np.int16),
+)
+
+
+class SharedResults:
+    """
+    One shared-memory block holding a (trials, players) array per field.
+
+    >>> res = SharedResults(2, 3)
+    >>> res.wealth[1] = [1.0, 2.0, 3.0]
+    >>> other = SharedResults(2, 3, name=res.name)
+    >>> other.wealth[1].tolist()
+    [1.0, 2.0, 3.0]
+    >>> other.close(); res.close(); res.unlink()
+    """
+    def __init__(self, num_trials, num_players, name=None):
+        self.shape = (num_trials, num_players)
+        size = sum(np.dtype(dt).itemsize for _, dt in FIELDS) * num_trials * num_players
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+            self.owner = True
+        else:
+            # pool workers share the parent's resource tracker, only the owner unlinks
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.name = self.shm.name
+        offset = 0
+        for field, dt in FIELDS:
+            arr = np.ndarray(self.shape, dtype=dt, buffer=self.shm.buf, offset=offset)
+            setattr(self, field, arr)
+            offset += arr.nbytes
+
+    def write_trial(self, trial, players, codes):
+        self.wealth[trial] = [p.wealth for p in players]
+        self.reputation[trial] = [p.reputation for p in players]
+        self.bankrupt[trial] = [p.bankrupt for p in players]
+        self.strategy[trial] = codes
+
+    def close(self):
+        for field, _ in FIELDS:
+            setattr(self, field, None)
+        self.shm.close()
+
+    def unlink(self):
+        if self.owner:
+            self.shm.unlink()
+
+
+def strategy_layout(config):
+    """Strategy names and the per-player strategy code, in run_simulation's player order.
+
+    >>> from config import GameConfig
+    >>> strategy_layout(GameConfig(player_counts={'TFT': 2, 'AllD': 1}))
+    (['TFT', 'AllD'], [0, 0, 1])
+    """
+    names, codes = [], []
+    for key, count in config.player_counts.items():
+        names.append(STRATEGY_MAP[key].name)
+        codes += [len(names) - 1] * count
+    return names, codes
+
+
+def aggregate_shared(results, names):
+    """Same output as aggregate_monte_carlo_results, from the shared arrays.
+
+    >>> res = SharedResults(2, 2)
+    >>> res.wealth[:] = [[10.0, -1.0], [20.0, 5.0]]
+    >>> res.bankrupt[:] = [[False, True], [False, False]]
+    >>> res.strategy[:] = [0, 1]
+    >>> summary = aggregate_shared(res, ['TFT', 'AllD'])
+    >>> summary['TFT']['wealth_mean'], summary['AllD']['survival_mean']
+    (15.0, 0.5)
+    >>> res.close(); res.unlink()
+    """
+    codes = results.strategy[0]
+    summary = {}
+    for code, name in enumerate(names):
+        mask = codes == code
+        if not mask.any():
+            continue
+        survival = (~results.bankrupt[:, mask]).mean(axis=1)
+        wealth = results.wealth[:, mask].mean(axis=1)
+        summary[name] = {
+            'survival_mean': survival.mean(),
+            'survival_std': survival.std(),
+            'wealth_mean': wealth.mean(),
+            'wealth_std': wealth.std(),
+            'n_trials': len(survival),
+        }
+    return summary
+
+
+_worker = {}
+
+
+def _init_worker(name, shape, config, entropy):
+    _worker['results'] = SharedResults(*shape, name=name)
+    _worker['config'] = config
+    _worker['seeds'] = np.random.SeedSequence(entropy).spawn(shape[0])
+    _worker['codes'] = strategy_layout(config)[1]
+
+
+def _run_trial(trial):
+    start = time.perf_counter()
+    telemetry = []
+    players = run_simulation(_worker['config'], telemetry=telemetry, seed=_worker['seeds'][trial])
+    _worker['results'].write_trial(trial, players, _worker['codes'])
+    return time.perf_counter() - start, rounds_played(_worker['config'], telemetry)
+
+
+def run_monte_carlo_shared(config, workers=None, progress=None, label='monte_carlo'):
+    """
+    run_monte_carlo + aggregate_monte_carlo_results, with the trials spread
+    over a process pool that writes straight into shared memory.
+
+    >>> from config import GameConfig
+    >>> summary = run_monte_carlo_shared(GameConfig(num_rounds=20, num_trials=3), workers=1,
+    ...                                  progress=Progress(stream=None))
+    >>> summary['TFT']['n_trials']
+    3
+    """
+    names, codes = strategy_layout(config)
+    shape = (config.num_trials, len(codes))
+    entropy = np.random.SeedSequence(config.seed).entropy
+    results = SharedResults(*shape)
+    workers = workers or os.cpu_count() or 1
+    if progress is None:
+        progress = Progress()
+    progress.start(label, shape[0], config.num_rounds, workers)
+    try:
+        if workers == 1:
+            seeds = np.random.SeedSequence(entropy).spawn(shape[0])
+            for trial in range(shape[0]):
+                start = time.perf_counter()
+                telemetry = []
+                results.write_trial(trial, run_simulation(config, telemetry=telemetry, seed=seeds[trial]), codes)
+                progress.trial_done(label, time.perf_counter() - start, rounds=rounds_played(config, telemetry))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(results.name, shape, config, entropy)) as pool:
+                for seconds, rounds in pool.map(_run_trial, range(shape[0]), chunksize=max(1, shape[0] // (4 * workers))):
+                    progress.trial_done(label, seconds, rounds=rounds)
+        progress.finish(label)
+        return aggregate_shared(results, names)
+    finally:
+        results.close()
+        results.unlink()
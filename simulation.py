@@ -1,11 +1,21 @@
 #chatgpt used
+import os
 import random
+import time
+import warnings
 from environment import EnvironmentUpdater
 from player import (
     OpponentView,
     AllC, AllD, TFT, GRIM,
 )
 from player import STRATEGY_MAP
+from topology import Topology
+from matchmaking import PartnerChoiceMatcher
+from coalitions import CoalitionTracker
+from interaction_trace import TraceWriter
+from steady_state import SteadyStateDetector
+from rng import RandomStream, trial_seeds
+from progress import Progress
 import numpy as np
 
 
@@ -42,10 +52,11 @@ class PlayerWrapper:
         v._weight = self.weights.get(opp_id, 0)
         return v
 
+    def intended_action(self, opponent):
+        return self.strategy.strategy(self._build_opponent_view(opponent))
+
     def choose_action(self, opponent, env):
-        opponent_view = self._build_opponent_view(opponent)
-        action = self.strategy.strategy(opponent_view)
-        return env.apply_noise(action, self.noise)
+        return env.apply_noise(self.intended_action(opponent), self.noise)
 
     def _ensure_history(self, opponent_id):
         if opponent_id not in self.my_history:
@@ -94,14 +105,18 @@ def play_round(p1, p2, env, config):
     >>> p2.weights[0]
     0
     """
-    a1 = p1.choose_action(p2, env)
-    a2 = p2.choose_action(p1, env)
+    i1 = p1.intended_action(p2)
+    a1 = env.apply_noise(i1, p1.noise)
+    i2 = p2.intended_action(p1)
+    a2 = env.apply_noise(i2, p2.noise)
     p1.record_actions(p2.id, a1, a2)
     p2.record_actions(p1.id, a2, a1)
+    if env.trace is not None:
+        env.trace.record(p1, p2, i1, i2, a1, a2, *config.payoff[(a1, a2)])
     env.update_all(p1, p2, a1, a2, config)
 
 
-def random_pairing(players):
+def random_pairing(players, rng=random):
     """
     >>> p1 = PlayerWrapper(0, AllC)
     >>> p2 = PlayerWrapper(1, AllD)
@@ -119,58 +134,218 @@ def random_pairing(players):
     1
     """
     active = [p for p in players if not p.bankrupt]
-    random.shuffle(active)
+    rng.shuffle(active)
     pairs = []
     for i in range(0, len(active) - 1, 2):
         pairs.append((active[i], active[i + 1]))
     return pairs
 
 
-def run_simulation(config):
-    player_counts = config.player_counts
-    rounds = config.num_rounds
-    initial_wealth = config.initial_wealth
-    noise = config.noise
-
-    env = EnvironmentUpdater()
+def make_players(config, rng=None):
     players = []
     player_id = 0
-
-    for strategy_name, count in player_counts.items():
+    for strategy_name, count in config.player_counts.items():
         strategy_class = STRATEGY_MAP[strategy_name]
         for _ in range(count):
-            player = PlayerWrapper(player_id, strategy_class, initial_wealth, noise)
+            player = PlayerWrapper(player_id, strategy_class, config.initial_wealth, config.noise)
 
             if strategy_name == 'GTFT':
-                player.strategy = strategy_class(config.gtft_forgiveness)
+                player.strategy = strategy_class(config.gtft_forgiveness, rng=rng)
             elif strategy_name == 'ReputationAwareTFT':
-                player.strategy = strategy_class(config.reputation_threshold, config.ratft_high_rep_threshold)
+                player.strategy = strategy_class(config.reputation_threshold, config.ratft_high_rep_threshold, rng=rng)
             elif strategy_name == 'CoalitionBuilder':
                 player.strategy = strategy_class(config.network_threshold)
+            elif strategy_name == 'RAND':
+                player.strategy = strategy_class(rng)
             else:
                 player.strategy = strategy_class()
 
             players.append(player)
             player_id += 1
+    return players
+
+
+def _players_from_kernel(config, state):
+    # the kernel keeps only the last action per pair, so histories stay empty
+    players = make_players(config)
+    for p in players:
+        p.wealth = float(state['wealth'][p.id])
+        p.reputation = float(state['reputation'][p.id])
+        p.bankrupt = bool(state['bankrupt'][p.id])
+        played = np.flatnonzero(state['last'][p.id] >= 0)
+        p.weights = dict(zip(played.tolist(), state['weights'][p.id, played].tolist()))
+    return players
+
+
+def run_simulation(config, telemetry=None, trace_path=None, seed=None, rng=None):
+    """
+    Every random draw of the trial comes from one RandomStream seeded with
+    `seed` (or config.seed), so a seeded trial is reproducible on its own.
+    Pass `rng` to supply the stream directly.
+
+    With config.engine == 'jit' the trial runs on the compiled kernel in
+    kernel.py when numba is installed and the config is supported there;
+    otherwise it runs on this engine.
+
+    >>> from config import GameConfig
+    >>> config = GameConfig(num_rounds=50, player_counts={'GTFT': 4, 'RAND': 4}, seed=3)
+    >>> [p.wealth for p in run_simulation(config)] == [p.wealth for p in run_simulation(config)]
+    True
+
+    A trial that raises still closes its trace with every record played so far:
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'trial.bin')
+    >>> stream = RandomStream(0)
+    >>> draws = iter(range(500))
+    >>> stream.random = lambda: next(draws) / 500
+    >>> try:
+    ...     run_simulation(config, trace_path=path, rng=stream)
+    ... except (StopIteration, RuntimeError):
+    ...     pass
+    >>> os.path.getsize(path) > 0
+    True
+    """
+    if seed is None:
+        seed = config.seed
+    if config.engine == 'jit':
+        # numba costs ~150 ms to import, so only jit runs pay for it
+        import kernel
+        if kernel.HAVE_NUMBA and rng is None and trace_path is None and kernel.supports(config):
+            return _players_from_kernel(config, kernel.run_trial(config, seed))
+        if not kernel.HAVE_NUMBA:
+            warnings.warn("numba is not installed, engine='jit' runs on the Python engine")
+    elif config.engine != 'python':
+        raise ValueError(f"Unknown engine {config.engine!r}, expected 'python' or 'jit'")
+
+    rounds = config.num_rounds
+    rng = rng or RandomStream(seed)
+    env = EnvironmentUpdater(rng=rng)
+    players = make_players(config, rng)
+
+    def pairing(active_players):
+        return random_pairing(active_players, rng)
 
-    for round_num in range(rounds):
-        for p1, p2 in random_pairing(players):
-            play_round(p1, p2, env, config)
+    if config.matching == 'partner_choice':
+        if config.topology is not None:
+            raise ValueError("partner_choice matching needs a fully mixed population (topology=None)")
+        pairing = PartnerChoiceMatcher(len(players),
+                                       reputation_bias=config.choice_reputation_bias,
+                                       trust_bias=config.choice_trust_bias,
+                                       rng=rng).pairing
+    elif config.matching != 'random':
+        raise ValueError(f"Unknown matching {config.matching!r}, expected 'random' or 'partner_choice'")
+
+    if config.topology is not None:
+        topology = Topology.build(config.topology, len(players),
+                                  degree=config.topology_degree,
+                                  rewire_prob=config.rewire_prob,
+                                  stream=rng)
+        for player in players:
+            player.weights = topology.weight_view(player.id)
+        pairing = topology.pairing
+
+    if config.track_coalitions:
+        env.coalitions = CoalitionTracker([p.strategy.name for p in players],
+                                          config.network_threshold,
+                                          config.coalition_rebuild_every)
+
+    if trace_path is not None:
+        env.trace = TraceWriter(trace_path, players, config)
+
+    detector = None
+    # traces and coalition series need every round, so they never skip ahead
+    if config.fast_forward and env.trace is None and env.coalitions is None:
+        detector = SteadyStateDetector(config, players, config.fast_forward,
+                                       config.steady_window, config.fast_forward_tol, rng)
+
+    try:
+        for round_num in range(rounds):
+            if env.trace is not None:
+                env.trace.round = round_num
+            for p1, p2 in pairing(players):
+                play_round(p1, p2, env, config)
+            if env.coalitions is not None:
+                env.coalitions.end_round(round_num)
+            if detector is not None:
+                detector.observe(round_num, env)
+                if (round_num + 1) % detector.window == 0 and \
+                        detector.try_fast_forward(round_num, rounds - round_num - 1):
+                    if telemetry is not None:
+                        telemetry.append(detector.info)
+                    break
+    finally:
+        # a trial that raises still flushes its records and closes the file
+        if env.trace is not None:
+            env.trace.close()
+
+    if env.coalitions is not None:
+        for player, size in zip(players, env.coalitions.component_sizes()):
+            player.coalition_size = size
+        if telemetry is not None:
+            telemetry.extend(env.coalitions.history)
     return players
 
 
-def run_monte_carlo(config):
+def run_monte_carlo(config, trace_dir=None, progress=None, label='monte_carlo', telemetry=None):
+    """
+    One analyze_trial result per trial. Progress is reported to `progress`
+    under `label` (a terminal-only Progress when not given). Pass a list as
+    `telemetry` to receive each trial's run_simulation telemetry (the
+    per-round coalition series, fast-forward records).
+
+    >>> from config import GameConfig
+    >>> from progress import Progress
+    >>> config = GameConfig(num_rounds=30, num_trials=2, track_coalitions=True, seed=1,
+    ...                     network_threshold=2.0, player_counts={'AllC': 4, 'TFT': 4})
+    >>> series = []
+    >>> results = run_monte_carlo(config, progress=Progress(stream=None), telemetry=series)
+    >>> len(series), len(series[0])
+    (2, 30)
+    >>> summary = aggregate_monte_carlo_results(results)
+    >>> summary['TFT']['largest_final'] >= summary['TFT']['largest_mean'] > 1
+    True
+    """
     num_trials = config.num_trials
     results = []
+    if trace_dir is not None:
+        os.makedirs(trace_dir, exist_ok=True)
+    if progress is None:
+        progress = Progress()
+    progress.start(label, num_trials, config.num_rounds)
+    seeds = trial_seeds(config.seed, num_trials)
     for trial in range(num_trials):
-        if trial % 100 == 0:
-            print(f"Trial {trial}/{num_trials}")
-        players = run_simulation(config)
-        results.append(analyze_trial(players))
+        start = time.perf_counter()
+        trace_path = None if trace_dir is None else os.path.join(trace_dir, f'trial_{trial:04d}.bin')
+        trial_telemetry = []
+        players = run_simulation(config, telemetry=trial_telemetry, trace_path=trace_path, seed=seeds[trial])
+        results.append(analyze_trial(players, trial_telemetry))
+        if telemetry is not None:
+            telemetry.append(trial_telemetry)
+        progress.trial_done(label, time.perf_counter() - start, rounds=rounds_played(config, trial_telemetry))
+    progress.finish(label)
     return results
 
 
-def analyze_trial(players):
+def rounds_played(config, telemetry):
+    """Rounds a trial actually simulated: up to its fast-forward, else all of them.
+
+    >>> from config import GameConfig
+    >>> config = GameConfig(num_rounds=3000)
+    >>> rounds_played(config, []), rounds_played(config, [{'fast_forward': 'exact', 'round': 499}])
+    (3000, 500)
+    """
+    for entry in telemetry:
+        if 'fast_forward' in entry:
+            return entry['round'] + 1
+    return config.num_rounds
+
+
+#per-trial summaries of the per-round coalition series, aggregated like coalition_rate
+SERIES_FIELDS = ('coalitions_mean', 'largest_mean', 'largest_final', 'member_rate_mean')
+
+
+def analyze_trial(players, telemetry=None):
     """
     >>> p1 = PlayerWrapper(0, AllC, initial_wealth=50)
     >>> p1.strategy = AllC()
@@ -190,6 +365,15 @@ def analyze_trial(players):
     0
     >>> result['AllD']['survival_rate']
     0.0
+    >>> p1.coalition_size, p2.coalition_size, p3.coalition_size = 2, 2, 1
+    >>> result = analyze_trial([p1, p2, p3])
+    >>> result['AllC']['coalition_rate'], result['AllD']['coalition_rate']
+    (1.0, 0.0)
+    >>> series = [{'coalitions': 0, 'largest': 1, 'members': {}, 'round': 0},
+    ...           {'coalitions': 1, 'largest': 2, 'members': {'AllC': 2}, 'round': 1}]
+    >>> result = analyze_trial([p1, p2, p3], series)
+    >>> result['AllC']['largest_mean'], result['AllC']['largest_final'], result['AllC']['member_rate_mean']
+    (1.5, 2, 0.5)
     """
     by_strategy = {}
     for p in players:
@@ -206,11 +390,30 @@ def analyze_trial(players):
             by_strategy[strategy_name]['survived'] += 1
         by_strategy[strategy_name]['total_wealth'] += p.wealth
         by_strategy[strategy_name]['final_wealth'].append(p.wealth)
+        # only set when the trial tracked coalitions
+        if hasattr(p, 'coalition_size'):
+            data = by_strategy[strategy_name]
+            data['in_coalition'] = data.get('in_coalition', 0) + (p.coalition_size >= 2)
 
     for strategy_name in by_strategy:
         data = by_strategy[strategy_name]
         data['survival_rate'] = data['survived'] / data['total']
         data['avg_wealth'] = data['total_wealth'] / data['total']
+        if 'in_coalition' in data:
+            data['coalition_rate'] = data['in_coalition'] / data['total']
+
+    # per-round coalition stats from run_simulation's telemetry; the counts are
+    # population-wide, member_rate_mean is this strategy's share in coalitions
+    series = [t for t in telemetry or () if 'coalitions' in t]
+    if series:
+        coalitions_mean = sum(t['coalitions'] for t in series) / len(series)
+        largest_mean = sum(t['largest'] for t in series) / len(series)
+        for strategy_name, data in by_strategy.items():
+            data['coalitions_mean'] = coalitions_mean
+            data['largest_mean'] = largest_mean
+            data['largest_final'] = series[-1]['largest']
+            data['member_rate_mean'] = sum(t['members'].get(strategy_name, 0) for t in series) \
+                / (len(series) * data['total'])
     return by_strategy
 
 
@@ -219,11 +422,17 @@ def aggregate_monte_carlo_results(results):
     for trial_result in results:
         for strategy, stats in trial_result.items():
             if strategy not in aggregated:
-                aggregated[strategy] = {'survival_rates': [], 'avg_wealths': []}
+                aggregated[strategy] = {'survival_rates': [], 'avg_wealths': [], 'coalition_rates': [],
+                                        **{field: [] for field in SERIES_FIELDS}}
             aggregated[strategy]['survival_rates'].append(stats['survival_rate'])
             aggregated[strategy]['avg_wealths'].append(stats['avg_wealth'])
+            if 'coalition_rate' in stats:
+                aggregated[strategy]['coalition_rates'].append(stats['coalition_rate'])
+            for field in SERIES_FIELDS:
+                if field in stats:
+                    aggregated[strategy][field].append(stats[field])
 
-    return {
+    summary = {
         strategy: {
             'survival_mean': np.mean(data['survival_rates']),
             'survival_std': np.std(data['survival_rates']),
@@ -233,6 +442,10 @@ def aggregate_monte_carlo_results(results):
         }
         for strategy, data in aggregated.items()
     }
-
-
-
+    for strategy, data in aggregated.items():
+        if data['coalition_rates']:
+            summary[strategy]['coalition_mean'] = np.mean(data['coalition_rates'])
+        for field in SERIES_FIELDS:
+            if data[field]:
+                summary[strategy][field] = np.mean(data[field])
+    return summary
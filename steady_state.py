@@ -0,0 +1,188 @@
+#steady-state detection and closed-form fast-forward of the remaining rounds
+#'exact': noise 0 and every survivor locked into mutual cooperation (or < 2 survivors)
+#'approx': stationary window -> linear wealth drift, error bounded against mean wealth
+import random
+import numpy as np
+from player import AllC, TFT, GTFT, GRIM, ReputationAwareTFT, CoalitionBuilder
+
+
+#with no noise these cooperate with a new partner and keep cooperating after C
+NICE_STRATEGIES = (AllC, TFT, GTFT, GRIM, ReputationAwareTFT, CoalitionBuilder)
+
+
+def cooperation_locked(active, config):
+    """True when, without noise, every future game between survivors is (C, C).
+
+    New pairs open with C, TFT-like strategies only look at the last move,
+    GRIM at the whole history with that opponent, and RA-TFT defects only
+    against reputations below its threshold (reputations only rise under C).
+
+    >>> from config import GameConfig
+    >>> from simulation import PlayerWrapper
+    >>> config = GameConfig(noise=0)
+    >>> a, b = PlayerWrapper(0, TFT, noise=0), PlayerWrapper(1, GRIM, noise=0)
+    >>> a.strategy, b.strategy = TFT(), GRIM()
+    >>> a.record_actions(1, 'D', 'C'); b.record_actions(0, 'C', 'D')
+    >>> cooperation_locked([a, b], config)
+    False
+    >>> a.record_actions(1, 'C', 'C'); b.record_actions(0, 'C', 'C')
+    >>> cooperation_locked([a, b], config)
+    False
+    >>> b.opp_history[0] = ['C', 'C']
+    >>> cooperation_locked([a, b], config)
+    True
+    """
+    if any(not isinstance(p.strategy, NICE_STRATEGIES) or p.noise > 0 for p in active):
+        return False
+    if config.alpha_c < 0:
+        return False
+    alive = {p.id for p in active}
+    if any(isinstance(p.strategy, ReputationAwareTFT) for p in active):
+        if min(p.reputation for p in active) < config.reputation_threshold:
+            return False
+    for p in active:
+        grim = isinstance(p.strategy, GRIM)
+        for opp_id, history in p.opp_history.items():
+            if opp_id not in alive or not history:
+                continue
+            if history[-1] != 'C' or (grim and 'D' in history):
+                return False
+    return True
+
+
+class SteadyStateDetector:
+    """
+    Watches a running trial and, once a steady state is found, applies the
+    remaining rounds to wealth and reputation in closed form. Histories and
+    network weights are not extended, so only use it when the outputs are
+    analyze_trial-level (run_simulation switches it off for traces/coalitions).
+
+    The detector draws from the trial's stream only when it skips, so a
+    seeded trial it never fast-forwards plays out exactly as with it off:
+
+    >>> from config import GameConfig
+    >>> from simulation import run_simulation
+    >>> def wealth(fast_forward):
+    ...     config = GameConfig(noise=0.05, num_rounds=300, seed=0, fast_forward=fast_forward,
+    ...                         player_counts={'AllC': 10, 'TFT': 10, 'GTFT': 10, 'RAND': 4})
+    ...     return [p.wealth for p in run_simulation(config)]
+    >>> wealth(False) == wealth('exact')
+    True
+
+    'approx' extrapolates a noisy stationary trial; each player's wealth
+    lands within its wealth_error of the fully played trial:
+
+    >>> def run(fast_forward):
+    ...     config = GameConfig(noise=0.05, num_rounds=1200, steady_window=300, seed=0,
+    ...                         fast_forward=fast_forward, player_counts={'AllC': 4, 'TFT': 4, 'GTFT': 4})
+    ...     telemetry = []
+    ...     return run_simulation(config, telemetry=telemetry), telemetry
+    >>> (skipped, info), (full, _) = run('approx'), run(False)
+    >>> info[0]['fast_forward'], info[0]['skipped']
+    ('approx', 300)
+    >>> all(abs(p.wealth - q.wealth) <= p.wealth_error for p, q in zip(skipped, full))
+    True
+    """
+    def __init__(self, config, players, mode='exact', window=100, tol=0.25, rng=None):
+        self.config = config
+        self.players = players
+        self.mode = mode
+        self.window = window
+        self.tol = tol
+        self.rng = rng or random
+        # exact sit-outs assume uniform random pairing of a fully mixed population
+        self.uniform_pairing = config.topology is None and config.matching == 'random'
+        self.wealth = []
+        self.coop = []
+        self.info = None
+
+    def observe(self, round_num, env):
+        if self.mode == 'approx':
+            self.wealth.append([p.wealth for p in self.players])
+            self.coop.append((env.cooperations, env.actions))
+            if len(self.wealth) > self.window + 1:
+                self.wealth.pop(0)
+                self.coop.pop(0)
+
+    def try_fast_forward(self, round_num, remaining):
+        """Called every `window` rounds; returns True if the trial was finished analytically."""
+        if remaining <= 0:
+            return False
+        active = [p for p in self.players if not p.bankrupt]
+        if len(active) < 2:
+            self.info = {'round': round_num, 'fast_forward': 'exact', 'skipped': remaining, 'max_error': 0.0}
+            return True
+        if self.uniform_pairing and self.config.noise == 0 and cooperation_locked(active, self.config):
+            if self._exact(active, remaining):
+                self.info = {'round': round_num, 'fast_forward': 'exact', 'skipped': remaining, 'max_error': 0.0}
+                return True
+        if self.mode == 'approx':
+            error = self._approx(active, remaining)
+            if error is not None:
+                self.info = {'round': round_num, 'fast_forward': 'approx', 'skipped': remaining, 'max_error': error}
+                return True
+        return False
+
+    def _exact(self, active, remaining):
+        r1, r2 = self.config.payoff[('C', 'C')]
+        # asymmetric or negative (C, C) payoffs would need seat order / new bankruptcies
+        if r1 != r2 or r1 < 0:
+            return False
+        n = len(active)
+        games = np.full(n, remaining, dtype=np.int64)
+        if n % 2:
+            # random_pairing leaves one uniformly chosen player out each round;
+            # seeded from the trial stream here, once the trial is being skipped
+            sit_outs = np.random.default_rng(self.rng.getrandbits(63))
+            games -= sit_outs.multinomial(remaining, [1.0 / n] * n)
+        config = self.config
+        for p, g in zip(active, games.tolist()):
+            p.wealth += r1 * g
+            p.reputation = min(config.reputation_max, p.reputation + config.alpha_c * g)
+        return True
+
+    def _approx(self, active, remaining):
+        if len(self.wealth) <= self.window:
+            return None
+        config = self.config
+        ids = [p.id for p in active]
+        # drift is measured over the rounds since the survivor set last changed
+        # (bankrupt wealth stays below the threshold), at least half a window
+        survivors = (np.array(self.wealth) >= config.wealth_threshold).sum(axis=1)
+        start = int(np.argmax(survivors == len(ids)))
+        if len(self.wealth) - start <= self.window // 2:
+            return None
+        wealth = np.array(self.wealth[start:])[:, ids]
+        # reputation only steers RA-TFT; require it pinned at a bound while one survives
+        step = config.alpha_c + config.alpha_d
+        if step > 0 and any(isinstance(p.strategy, ReputationAwareTFT) for p in active):
+            for p in active:
+                if min(config.reputation_max - p.reputation, p.reputation - config.reputation_min) > step:
+                    return None
+        coop = self.coop[start:]
+        half = len(coop) // 2
+        (c0, a0), (c1, a1), (c2, a2) = coop[0], coop[half], coop[-1]
+        if a1 == a0 or a2 == a1:
+            return None
+        rate1, rate2 = (c1 - c0) / (a1 - a0), (c2 - c1) / (a2 - a1)
+        # binomial standard error of the difference between the two half-window rates
+        p = (c2 - c0) / (a2 - a0)
+        se = np.sqrt(p * (1 - p) * (1 / (a1 - a0) + 1 / (a2 - a1)))
+        if abs(rate1 - rate2) > 2 * se + 1e-12:
+            return None
+
+        increments = np.diff(wealth, axis=0)
+        drift = increments.mean(axis=0)
+        sd = increments.std(axis=0, ddof=1)
+        # uncertainty in the drift estimate plus the spread of the remaining rounds
+        error = 2 * (remaining * sd / np.sqrt(len(increments)) + np.sqrt(remaining) * sd)
+        projected = wealth[-1] + drift * remaining
+        if np.any(projected - error < config.wealth_threshold):
+            return None
+        # every player's error against the survivors' mean final wealth
+        if error.max() > self.tol * projected.mean():
+            return None
+        for p, gain, err in zip(active, (drift * remaining).tolist(), error.tolist()):
+            p.wealth += gain
+            p.wealth_error = err
+        return float(error.max())
@@ -0,0 +1,267 @@
+#generic parameter-space sweeps over any GameConfig field
+#full grid, latin hypercube or sobol points -> parallel cached runs -> tidy DataFrame
+import copy
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from config import GameConfig
+from simulation import run_monte_carlo, aggregate_monte_carlo_results, rounds_played
+from progress import Progress
+from cache import engine_fingerprint, read_json, write_json
+
+
+CACHE_DIR = os.path.join('results', 'sweep_cache')
+
+# (s, a, m_1..m_s) for dimensions 2.. from Joe & Kuo's new-joe-kuo-6.21201 table
+SOBOL_TABLE = [
+    (1, 0, [1]),
+    (2, 1, [1, 3]),
+    (3, 1, [1, 3, 1]),
+    (3, 2, [1, 1, 1]),
+    (4, 1, [1, 1, 3, 3]),
+    (4, 4, [1, 3, 5, 13]),
+    (5, 2, [1, 1, 5, 5, 17]),
+    (5, 4, [1, 1, 5, 5, 5]),
+    (5, 7, [1, 1, 7, 11, 19]),
+    (5, 11, [1, 1, 5, 1, 1]),
+    (5, 13, [1, 1, 1, 3, 11]),
+    (5, 14, [1, 3, 5, 5, 31]),
+    (6, 1, [1, 3, 3, 9, 7, 49]),
+    (6, 13, [1, 1, 1, 15, 21, 21]),
+    (6, 16, [1, 3, 1, 13, 27, 49]),
+]
+SOBOL_BITS = 30
+
+
+def sobol(n, d, seed=None):
+    """First n points of a d-dimensional Sobol sequence with a random digital shift.
+
+    Any power-of-two prefix puts exactly one point in each 1/n slice of every axis.
+
+    >>> u = sobol(8, 3, seed=0)
+    >>> u.shape
+    (8, 3)
+    >>> [sorted((u[:, j] * 8).astype(int).tolist()) == list(range(8)) for j in range(3)]
+    [True, True, True]
+    """
+    if d > len(SOBOL_TABLE) + 1:
+        raise ValueError(f"Sobol sampling supports at most {len(SOBOL_TABLE) + 1} dimensions")
+    v = np.zeros((d, SOBOL_BITS), dtype=np.uint64)
+    for i in range(SOBOL_BITS):
+        v[0, i] = 1 << (SOBOL_BITS - 1 - i)
+    for j in range(1, d):
+        s, a, m = SOBOL_TABLE[j - 1]
+        for i in range(s):
+            v[j, i] = m[i] << (SOBOL_BITS - 1 - i)
+        for i in range(s, SOBOL_BITS):
+            value = v[j, i - s] ^ (v[j, i - s] >> np.uint64(s))
+            for k in range(1, s):
+                if (a >> (s - 1 - k)) & 1:
+                    value ^= v[j, i - k]
+            v[j, i] = value
+
+    rng = np.random.default_rng(seed)
+    x = rng.integers(0, 1 << SOBOL_BITS, size=d, dtype=np.uint64)
+    points = np.empty((n, d), dtype=np.uint64)
+    for i in range(n):
+        points[i] = x
+        # gray-code order: flip the direction number of the lowest zero bit of i
+        c = (~i & (i + 1)).bit_length() - 1
+        x = x ^ v[:, c]
+    return points / float(1 << SOBOL_BITS)
+
+
+def latin_hypercube(n, d, seed=None):
+    """
+    >>> u = latin_hypercube(5, 2, seed=0)
+    >>> [sorted((u[:, j] * 5).astype(int).tolist()) for j in range(2)]
+    [[0, 1, 2, 3, 4], [0, 1, 2, 3, 4]]
+    """
+    rng = np.random.default_rng(seed)
+    strata = np.argsort(rng.random((d, n)), axis=1).T
+    return (strata + rng.random((n, d))) / n
+
+
+def _scale(u, spec):
+    """Map u in [0, 1) onto a (low, high) range or a list of discrete values."""
+    if isinstance(spec, tuple):
+        low, high = spec
+        return low + u * (high - low)
+    return spec[min(int(u * len(spec)), len(spec) - 1)]
+
+
+def sample_points(ranges, method='grid', n=None, levels=5, seed=None):
+    """
+    ranges maps a field path to a (low, high) tuple or a list of values.
+    Grid uses lists as given and `levels` evenly spaced values for tuples.
+
+    >>> pts = sample_points({'noise': [0.0, 0.1], 'alpha_d': (0.0, 0.1)}, levels=3)
+    >>> len(pts), pts[1]
+    (6, {'noise': 0.0, 'alpha_d': 0.05})
+    >>> pts = sample_points({'noise': (0.0, 0.3), 'player_counts.TFT': (5, 15)}, 'lhs', n=4, seed=1)
+    >>> len(pts), all(isinstance(p['player_counts.TFT'], int) for p in pts)
+    (4, True)
+    """
+    names = list(ranges)
+    points = _sample_unit(ranges, names, method, n, levels, seed)
+    # player counts are integers, record them the way apply_params will use them
+    for params in points:
+        for name in names:
+            if name.startswith('player_counts.'):
+                params[name] = int(round(params[name]))
+    return points
+
+
+def _sample_unit(ranges, names, method, n, levels, seed):
+    if method == 'grid':
+        axes = [
+            np.linspace(*spec, levels).tolist() if isinstance(spec, tuple) else list(spec)
+            for spec in ranges.values()
+        ]
+        grid = np.array(np.meshgrid(*[np.arange(len(a)) for a in axes], indexing='ij')).reshape(len(axes), -1).T
+        return [{name: axes[j][k] for j, (name, k) in enumerate(zip(names, idx))} for idx in grid]
+
+    if n is None:
+        raise ValueError(f"{method} sampling needs the number of points n")
+    if method == 'lhs':
+        u = latin_hypercube(n, len(names), seed)
+    elif method == 'sobol':
+        u = sobol(n, len(names), seed)
+    else:
+        raise ValueError(f"Unknown sampling method {method!r}, expected 'grid', 'lhs' or 'sobol'")
+    return [
+        {name: _scale(float(u[i, j]), ranges[name]) for j, name in enumerate(names)}
+        for i in range(n)
+    ]
+
+
+def apply_params(config, params):
+    """Set fields on a GameConfig by path.
+
+    'payoff.CD.0' is the row player's payoff for (C, D) and
+    'player_counts.TFT' the number of TFT players (rounded to an int).
+
+    >>> config = apply_params(GameConfig(), {'noise': 0.2, 'payoff.CD.1': 7, 'player_counts.TFT': 4.6})
+    >>> config.noise, config.payoff[('C', 'D')], config.player_counts['TFT']
+    (0.2, (-5, 7), 5)
+    """
+    for path, value in params.items():
+        parts = path.split('.')
+        if parts[0] == 'payoff':
+            key = tuple(parts[1])
+            entry = list(config.payoff[key])
+            entry[int(parts[2])] = value
+            config.payoff = {**config.payoff, key: tuple(entry)}
+        elif parts[0] == 'player_counts':
+            config.player_counts = {**config.player_counts, parts[1]: int(round(value))}
+        elif hasattr(config, path):
+            setattr(config, path, value)
+        else:
+            raise ValueError(f"GameConfig has no field {path!r}")
+    return config
+
+
+def make_configs(points, base=None):
+    base_config = GameConfig(**(base or {}))
+    return [apply_params(copy.deepcopy(base_config), params) for params in points]
+
+
+def config_key(config):
+    """Stable hash of every field, used as the per-point cache key.
+
+    >>> config_key(GameConfig()) == config_key(GameConfig())
+    True
+    >>> config_key(GameConfig()) == config_key(GameConfig(noise=0.1))
+    False
+    """
+    fields = dict(vars(config))
+    fields['payoff'] = {''.join(k): v for k, v in config.payoff.items()}
+    blob = json.dumps(fields, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode()).hexdigest()
+
+
+def run_point(config, cache_dir=CACHE_DIR, telemetry=None):
+    """Aggregated Monte Carlo results for one config, read from cache when present.
+    `telemetry` receives the run_monte_carlo series of a point that had to be run.
+
+    Points are cached under the config plus the engine fingerprint, so an edit
+    to the simulation code re-runs them. Unseeded points are never cached:
+    their results are a fresh draw every time.
+
+    >>> import tempfile
+    >>> cache_dir = tempfile.mkdtemp()
+    >>> config = GameConfig(num_rounds=10, num_trials=2, player_counts={'TFT': 2, 'AllD': 2})
+    >>> _ = run_point(config, cache_dir)
+    >>> os.listdir(cache_dir)
+    []
+    >>> config.seed = 1
+    >>> run_point(config, cache_dir) == run_point(config, cache_dir), len(os.listdir(cache_dir))
+    (True, 1)
+    """
+    path = None
+    if cache_dir is not None and config.seed is not None:
+        key = hashlib.sha1((engine_fingerprint() + config_key(config)).encode()).hexdigest()
+        path = os.path.join(cache_dir, key + '.json')
+        if os.path.exists(path):
+            return read_json(path)
+    summary = aggregate_monte_carlo_results(run_monte_carlo(config, progress=Progress(stream=None),
+                                                            telemetry=telemetry))
+    summary = {s: {k: v.item() if hasattr(v, 'item') else v for k, v in stats.items()}
+               for s, stats in summary.items()}
+    if path is not None:
+        write_json(path, summary)
+    return summary
+
+
+def to_frame(points, summaries):
+    """One row per (point, strategy): parameter columns, then the aggregate statistics."""
+    import pandas as pd
+    rows = []
+    for i, (params, summary) in enumerate(zip(points, summaries)):
+        for strategy, stats in summary.items():
+            rows.append({'point': i, **params, 'strategy': strategy, **stats})
+    return pd.DataFrame(rows)
+
+
+def _timed_point(config, cache_dir):
+    # a cached point simulates no rounds
+    start = time.perf_counter()
+    telemetry = []
+    summary = run_point(config, cache_dir, telemetry)
+    return summary, time.perf_counter() - start, sum(rounds_played(config, t) for t in telemetry)
+
+
+def run_sweep(ranges, method='grid', n=None, levels=5, seed=None, base=None,
+              workers=None, cache_dir=CACHE_DIR, progress=None):
+    """
+    Sweep `ranges` (see sample_points) around the GameConfig built from `base`,
+    running every point in a process pool and caching each point's result.
+
+    e.g. noise x alpha_d x K on a 64-point Sobol design:
+    run_sweep({'noise': (0.0, 0.3), 'alpha_d': (0.0, 0.1), 'network_threshold': (1.0, 12.0)},
+              method='sobol', n=64, base={'num_trials': 20})
+    """
+    points = sample_points(ranges, method, n, levels, seed)
+    configs = make_configs(points, base)
+    if progress is None:
+        progress = Progress()
+    serial = workers == 1 or len(configs) <= 1
+    progress.start('sweep', sum(c.num_trials for c in configs), configs[0].num_rounds if configs else 0,
+                   1 if serial else workers or os.cpu_count() or 1)
+    summaries = [None] * len(configs)
+    if serial:
+        for i, c in enumerate(configs):
+            summaries[i], seconds, rounds = _timed_point(c, cache_dir)
+            progress.trial_done('sweep', seconds, c.num_trials, rounds)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_timed_point, c, cache_dir): i for i, c in enumerate(configs)}
+            for future in as_completed(futures):
+                i = futures[future]
+                summaries[i], seconds, rounds = future.result()
+                progress.trial_done('sweep', seconds, configs[i].num_trials, rounds)
+    progress.finish('sweep')
+    return to_frame(points, summaries)
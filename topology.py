@@ -0,0 +1,246 @@
+#interaction topologies: players are only paired with their graph neighbors
+#the graph is generated once per trial and stored as CSR neighbor arrays
+import random
+from bisect import bisect_left
+import numpy as np
+
+
+TOPOLOGIES = ('ring', 'lattice', 'small_world', 'scale_free')
+
+
+def _to_csr(n, u, v):
+    """Symmetric, deduplicated CSR arrays from an undirected edge list.
+
+    >>> indptr, indices = _to_csr(3, np.array([0, 1, 1]), np.array([1, 0, 2]))
+    >>> indptr.tolist(), indices.tolist()
+    ([0, 1, 3, 4], [1, 0, 2, 1])
+    """
+    u = np.asarray(u, dtype=np.int64)
+    v = np.asarray(v, dtype=np.int64)
+    keep = u != v
+    u, v = u[keep], v[keep]
+    keys = np.unique(np.concatenate([u * n + v, v * n + u]))
+    rows, cols = keys // n, keys % n
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, cols
+
+
+def ring_edges(n, degree):
+    """Each node is linked to its degree // 2 nearest nodes on either side.
+
+    >>> u, v = ring_edges(5, 2)
+    >>> sorted(zip(u.tolist(), v.tolist()))
+    [(0, 1), (1, 2), (2, 3), (3, 4), (4, 0)]
+    """
+    half = max(1, degree // 2)
+    nodes = np.arange(n)
+    u = np.repeat(nodes, half)
+    v = (u + np.tile(np.arange(1, half + 1), n)) % n
+    return u, v
+
+
+def lattice_edges(n):
+    """2-D torus with von Neumann neighborhoods; nodes past n are dropped.
+
+    >>> u, v = lattice_edges(4)
+    >>> sorted(zip(u.tolist(), v.tolist()))
+    [(0, 1), (0, 2), (1, 0), (1, 3), (2, 0), (2, 3), (3, 1), (3, 2)]
+    """
+    cols = int(np.ceil(np.sqrt(n)))
+    rows = int(np.ceil(n / cols))
+    nodes = np.arange(n)
+    r, c = nodes // cols, nodes % cols
+    right = r * cols + (c + 1) % cols
+    down = ((r + 1) % rows) * cols + c
+    u = np.concatenate([nodes, nodes])
+    v = np.concatenate([right, down])
+    keep = v < n
+    return u[keep], v[keep]
+
+
+def small_world_edges(n, degree, rewire_prob, rng):
+    """Watts-Strogatz: ring edges whose far end is rewired with rewire_prob.
+
+    >>> rng = np.random.default_rng(0)
+    >>> u, v = small_world_edges(10, 4, 0.0, rng)
+    >>> len(u)
+    20
+    """
+    u, v = ring_edges(n, degree)
+    rewire = rng.random(len(u)) < rewire_prob
+    v = v.copy()
+    v[rewire] = rng.integers(0, n, size=int(rewire.sum()))
+    return u, v
+
+
+def scale_free_edges(n, degree, rng):
+    """Barabasi-Albert preferential attachment with degree // 2 links per new node.
+
+    >>> rng = np.random.default_rng(0)
+    >>> u, v = scale_free_edges(20, 4, rng)
+    >>> len(u)
+    37
+    """
+    m = max(1, degree // 2)
+    seed = min(n, m + 1)
+    u, v = [], []
+    for i in range(seed):
+        for j in range(i + 1, seed):
+            u.append(i)
+            v.append(j)
+    # every edge endpoint appears once here, so uniform draws are degree-biased
+    targets = u + v
+    for new in range(seed, n):
+        chosen = set()
+        while len(chosen) < m:
+            chosen.add(targets[int(rng.integers(len(targets)))])
+        for t in chosen:
+            u.append(new)
+            v.append(t)
+            targets.append(new)
+            targets.append(t)
+    return np.array(u, dtype=np.int64), np.array(v, dtype=np.int64)
+
+
+class NeighborWeights:
+    """Dict-like view of one node's network weights, backed by the edge array.
+
+    Only existing edges can hold a weight, so update_network works unchanged.
+
+    >>> topo = Topology.build('ring', 4, degree=2)
+    >>> w = topo.weight_view(0)
+    >>> w.get(1, 0), w.get(2, 0)
+    (0.0, 0)
+    >>> w[1] = 3.0
+    >>> w[1], topo.weight_view(1).get(0, 0)
+    (3.0, 0.0)
+    >>> w[2] = 1.0
+    Traceback (most recent call last):
+    ...
+    KeyError: 2
+    """
+    def __init__(self, topology, node):
+        self.topology = topology
+        self.node = node
+
+    def _slot(self, other):
+        topo = self.topology
+        lo, hi = topo.indptr_list[self.node], topo.indptr_list[self.node + 1]
+        k = bisect_left(topo.indices_list, other, lo, hi)
+        if k < hi and topo.indices_list[k] == other:
+            return k
+        return -1
+
+    def get(self, other, default=None):
+        k = self._slot(other)
+        return float(self.topology.weights[k]) if k >= 0 else default
+
+    def __getitem__(self, other):
+        k = self._slot(other)
+        if k < 0:
+            raise KeyError(other)
+        return float(self.topology.weights[k])
+
+    def __setitem__(self, other, value):
+        k = self._slot(other)
+        if k < 0:
+            raise KeyError(other)
+        self.topology.weights[k] = value
+
+    def __contains__(self, other):
+        return self._slot(other) >= 0
+
+    def __len__(self):
+        return self.topology.indptr_list[self.node + 1] - self.topology.indptr_list[self.node]
+
+    def items(self):
+        lo, hi = self.topology.indptr_list[self.node], self.topology.indptr_list[self.node + 1]
+        return [(self.topology.indices_list[k], float(self.topology.weights[k])) for k in range(lo, hi)]
+
+
+class Topology:
+    """
+    >>> topo = Topology.build('lattice', 9)
+    >>> topo.neighbors(4).tolist()
+    [1, 3, 5, 7]
+    >>> topo.num_edges
+    18
+    """
+    def __init__(self, n, indptr, indices, rng=None):
+        self.n = n
+        self.rng = rng or random
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = np.zeros(len(indices), dtype=np.float64)
+        # plain lists are much faster than numpy scalars in the per-pair loops
+        self.indptr_list = indptr.tolist()
+        self.indices_list = indices.tolist()
+
+    @classmethod
+    def build(cls, kind, n, degree=4, rewire_prob=0.1, seed=None, stream=None):
+        """stream (a RandomStream) drives the per-round matching and, without a seed, the graph."""
+        stream = stream or random
+        rng = np.random.default_rng(seed if seed is not None else stream.getrandbits(63))
+        if kind == 'ring':
+            u, v = ring_edges(n, degree)
+        elif kind == 'lattice':
+            u, v = lattice_edges(n)
+        elif kind == 'small_world':
+            u, v = small_world_edges(n, degree, rewire_prob, rng)
+        elif kind == 'scale_free':
+            u, v = scale_free_edges(n, degree, rng)
+        else:
+            raise ValueError(f"Unknown topology {kind!r}, expected one of {TOPOLOGIES}")
+        indptr, indices = _to_csr(n, u, v)
+        return cls(n, indptr, indices, stream)
+
+    @property
+    def num_edges(self):
+        return len(self.indices) // 2
+
+    def neighbors(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def weight_view(self, node):
+        return NeighborWeights(self, node)
+
+    def pairing(self, players):
+        """Random greedy matching restricted to graph edges, O(n + edges).
+
+        players must be indexed by id. Players left without a free active
+        neighbor sit out the round, like the odd player in random_pairing.
+
+        >>> from simulation import PlayerWrapper
+        >>> from player import AllC
+        >>> players = [PlayerWrapper(i, AllC) for i in range(6)]
+        >>> players[2].bankrupt = True
+        >>> topo = Topology.build('ring', 6, degree=2)
+        >>> pairs = topo.pairing(players)
+        >>> all(abs(a.id - b.id) in (1, 5) for a, b in pairs)
+        True
+        >>> any(2 in (a.id, b.id) for a, b in pairs)
+        False
+        """
+        order = [p.id for p in players if not p.bankrupt]
+        self.rng.shuffle(order)
+        free = bytearray(self.n)
+        for i in order:
+            free[i] = 1
+        indptr, indices = self.indptr_list, self.indices_list
+        pairs = []
+        for u in order:
+            if not free[u]:
+                continue
+            start = indptr[u]
+            deg = indptr[u + 1] - start
+            if deg == 0:
+                continue
+            offset = self.rng.randrange(deg)
+            for j in range(deg):
+                v = indices[start + (offset + j) % deg]
+                if free[v]:
+                    free[u] = free[v] = 0
+                    pairs.append((players[u], players[v]))
+                    break
+        return pairs
@@ -1,120 +1,261 @@
 #ai tool used
+#all checks go through run_trials: batched over a process pool, seeded, and cached
+#under a fingerprint of the engine sources, so an engine change re-runs everything
+import copy
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from config import GameConfig
-from simulation import run_simulation, aggregate_monte_carlo_results, analyze_trial
+from simulation import run_simulation, analyze_trial, rounds_played
+from rendering import RESULTS_DIR, save_results, render
+from rng import trial_seeds
+from sweep import config_key
+from cache import engine_fingerprint, read_json, write_json
+from progress import Progress
 import numpy as np
-import matplotlib.pyplot as plt
-import os
 
 
-def check_single_strategy(strategy_name, num_players, num_rounds):
-    config = GameConfig(
+CACHE_DIR = os.path.join(RESULTS_DIR, 'validation_cache')
+SUITE_SEED = 2025
+CHUNK_SIZE = 5
+
+class RunningMean:
+    """
+    Streaming mean and variance (Welford); curve holds the mean after each value.
+
+    >>> r = RunningMean()
+    >>> for x in [1.0, 2.0, 3.0, 6.0]:
+    ...     r.push(x)
+    >>> r.curve
+    [1.0, 1.5, 2.0, 3.0]
+    >>> r.n, r.mean, round(r.std, 4), round(r.se, 4)
+    (4, 3.0, 2.1602, 1.0801)
+    """
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.curve = []
+
+    def push(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        self.curve.append(self.mean)
+
+    @property
+    def std(self):
+        return (self.m2 / (self.n - 1)) ** 0.5 if self.n > 1 else 0.0
+
+    @property
+    def se(self):
+        return self.std / self.n ** 0.5 if self.n else 0.0
+
+
+def _run_chunk(config, seeds):
+    start = time.perf_counter()
+    results = []
+    rounds = 0
+    for seed in seeds:
+        telemetry = []
+        results.append(analyze_trial(run_simulation(config, telemetry=telemetry, seed=seed)))
+        rounds += rounds_played(config, telemetry)
+    return results, time.perf_counter() - start, rounds
+
+
+def _run_chunks(chunks, results, jobs, workers, progress):
+    progress.start('validation', sum(len(c[3]) for c in chunks),
+                   max(jobs[c[0]].num_rounds for c in chunks), workers)
+
+    def store(name, start, trial_results, seconds, rounds):
+        results[name][start:start + len(trial_results)] = trial_results
+        progress.trial_done('validation', seconds, len(trial_results), rounds)
+
+    if workers == 1 or len(chunks) <= 1:
+        for name, start, config, seeds in chunks:
+            store(name, start, *_run_chunk(config, seeds))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_run_chunk, config, seeds): (name, start)
+                       for name, start, config, seeds in chunks}
+            for future in as_completed(futures):
+                store(*futures[future], *future.result())
+    progress.finish('validation')
+
+
+def run_trials(jobs, workers=None, cache_dir=CACHE_DIR, progress=None):
+    """
+    jobs = {name: config}; returns {name: [analyze_trial result per trial]}.
+
+    Every config is seeded (SUITE_SEED unless it has its own seed; the
+    caller's configs are left untouched), so a job's trials are fixed and
+    cached by engine fingerprint + config.
+    Missing jobs are split into CHUNK_SIZE-trial chunks that all share one
+    process pool, which keeps every worker busy across checks.
+
+    >>> config = GameConfig(num_rounds=20, num_trials=3, player_counts={'TFT': 2, 'AllD': 2})
+    >>> a = run_trials({'x': config}, workers=1, cache_dir=None, progress=Progress(stream=None))
+    >>> b = run_trials({'x': config}, workers=1, cache_dir=None, progress=Progress(stream=None))
+    >>> len(a['x']), a == b, config.seed
+    (3, True, None)
+    """
+    fingerprint = engine_fingerprint()
+    results = {}
+    paths = {}
+    chunks = []
+    jobs = {name: copy.copy(config) for name, config in jobs.items()}
+    for name, config in jobs.items():
+        if config.seed is None:
+            config.seed = SUITE_SEED
+        if cache_dir is not None:
+            key = hashlib.sha1((fingerprint + config_key(config)).encode()).hexdigest()
+            paths[name] = os.path.join(cache_dir, key + '.json')
+            if os.path.exists(paths[name]):
+                results[name] = read_json(paths[name])
+                continue
+        seeds = trial_seeds(config.seed, config.num_trials)
+        results[name] = [None] * config.num_trials
+        chunks += [(name, start, config, seeds[start:start + CHUNK_SIZE])
+                   for start in range(0, config.num_trials, CHUNK_SIZE)]
+
+    pending = {c[0] for c in chunks}
+    if chunks:
+        _run_chunks(chunks, results, jobs, workers or os.cpu_count() or 1,
+                    progress if progress is not None else Progress())
+
+    if cache_dir is not None:
+        for name in pending:
+            write_json(paths[name], results[name])
+    return results
+
+
+def single_strategy_config(strategy_name, num_players, num_rounds):
+    return GameConfig(
         player_counts={strategy_name: num_players},
         num_rounds=num_rounds,
-        num_trials=1
+        num_trials=1,
+        fast_forward=False
     )
-    players = run_simulation(config)
-    wealth = [p.wealth for p in players]
-    bankruptcies = sum(p.bankrupt for p in players)
-    return np.mean(wealth), np.std(wealth), bankruptcies
 
-def check_extreme_parameter(param_name, param_value, num_rounds, num_trials=30):
-    results = []
-    for _ in range(num_trials):
-        config = GameConfig(num_rounds=num_rounds, num_trials=1, **{param_name: param_value})
-        players = run_simulation(config)
-        if param_name == 'noise':
-            tft = [p for p in players if p.strategy.name == "TFT"]
-            results.append(np.mean([p.wealth for p in tft]) if tft else 0)
 
-    return np.mean(results)
+def single_strategy_stats(trial_results):
+    (data,) = trial_results[0].values()
+    return np.mean(data['final_wealth']), np.std(data['final_wealth']), data['total'] - data['survived']
 
 
-def run_convergence(n_runs, strategies, num_rounds):
-    data = {s: {'wealth': [], 'survival': []} for s in strategies}
+def check_single_strategy(strategy_name, num_players, num_rounds, **kwargs):
+    config = single_strategy_config(strategy_name, num_players, num_rounds)
+    return single_strategy_stats(run_trials({'single': config}, **kwargs)['single'])
 
-    for n in range(1, n_runs + 1):
-        if n % 20 == 0:
-            print(f"  Run {n}/{n_runs}")
 
-        config = GameConfig(num_rounds=num_rounds, num_trials=1)
-        players = run_simulation(config)
-        trial_result = analyze_trial(players)
-        agg = aggregate_monte_carlo_results([trial_result])
+def extreme_parameter_config(param_name, param_value, num_rounds, num_trials=30):
+    return GameConfig(num_rounds=num_rounds, num_trials=num_trials, fast_forward=False,
+                      **{param_name: param_value})
 
-        for s in strategies:
-            if s in agg:
-                data[s]['wealth'].append(agg[s]['wealth_mean'])
-                data[s]['survival'].append(agg[s]['survival_mean'])
 
-    for s in strategies:
-        n = len(data[s]['wealth'])
-        data[s]['wealth'] = np.cumsum(data[s]['wealth']) / np.arange(1, n + 1)
-        data[s]['survival'] = np.cumsum(data[s]['survival']) / np.arange(1, n + 1)
+def tft_wealth(trial_results):
+    return np.mean([r['TFT']['avg_wealth'] if 'TFT' in r else 0 for r in trial_results])
 
-    return data
 
+def check_extreme_parameter(param_name, param_value, num_rounds, num_trials=30, **kwargs):
+    config = extreme_parameter_config(param_name, param_value, num_rounds, num_trials)
+    return tft_wealth(run_trials({'extreme': config}, **kwargs)['extreme'])
 
-def plot_convergence(data, strategies):
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 10))
 
-    for s in strategies:
-        n = len(data[s]['wealth'])
-        ax1.plot(range(1, n + 1), data[s]['wealth'], linewidth=2, label=s)
-        ax2.plot(range(1, n + 1), data[s]['survival'], linewidth=2, label=s)
+def convergence_config(n_runs, num_rounds):
+    return GameConfig(num_rounds=num_rounds, num_trials=n_runs, fast_forward=False)
+
+
+def convergence_curves(trial_results, strategies):
+    """
+    Running mean (and its standard error) of each strategy's wealth and
+    survival, updated one trial at a time.
+
+    >>> trials = [{'TFT': {'avg_wealth': w, 'survival_rate': 1.0}} for w in (10.0, 20.0, 30.0)]
+    >>> curves = convergence_curves(trials, ['TFT'])
+    >>> curves['TFT']['wealth'].tolist(), curves['TFT']['survival'].tolist()
+    ([10.0, 15.0, 20.0], [1.0, 1.0, 1.0])
+    """
+    stats = {s: {'wealth': RunningMean(), 'survival': RunningMean()} for s in strategies}
+    for trial_result in trial_results:
+        for s in strategies:
+            if s in trial_result:
+                stats[s]['wealth'].push(trial_result[s]['avg_wealth'])
+                stats[s]['survival'].push(trial_result[s]['survival_rate'])
+    return {
+        s: {
+            'wealth': np.array(stats[s]['wealth'].curve),
+            'survival': np.array(stats[s]['survival'].curve),
+            'wealth_se': stats[s]['wealth'].se,
+            'survival_se': stats[s]['survival'].se,
+        }
+        for s in strategies
+    }
 
-    ax1.set_title("Wealth Convergence", fontsize=14)
-    ax1.set_xlabel("Number of Runs")
-    ax1.set_ylabel("Cumulative Average Wealth")
-    ax1.legend()
-    ax1.grid(alpha=0.3)
 
-    ax2.set_title("Survival Rate Convergence", fontsize=14)
-    ax2.set_xlabel("Number of Runs")
-    ax2.set_ylabel("Cumulative Average Survival Rate")
-    ax2.legend()
-    ax2.grid(alpha=0.3)
+def run_convergence(n_runs, strategies, num_rounds, **kwargs):
+    config = convergence_config(n_runs, num_rounds)
+    return convergence_curves(run_trials({'convergence': config}, **kwargs)['convergence'], strategies)
 
-    plt.tight_layout()
-    os.makedirs('figures', exist_ok=True)
-    plt.savefig('figures/convergence.png', dpi=300)
 
+def validate(workers=None, cache_dir=CACHE_DIR, render_figure=True):
+    strategies = ['TFT', 'AllD', 'AllC']
+    # one batch for the whole suite, so the pool never waits between checks
+    results = run_trials({
+        'all_allc': single_strategy_config('AllC', 80, 1000),
+        'all_alld': single_strategy_config('AllD', 80, 1000),
+        'noise_0': extreme_parameter_config('noise', 0.0, 1000),
+        'noise_1': extreme_parameter_config('noise', 1.0, 1000),
+        'convergence': convergence_config(100, 500),
+    }, workers, cache_dir)
 
-def validate():
     print("=" * 70)
     print("SANITY CHECKS")
     print("=" * 70)
 
     print("\n1. All Same Strategy")
     print("All AllC (everyone cooperates):")
-    mean_w, std_w, bankruptcies = check_single_strategy('AllC', 80, 1000)
+    mean_w, std_w, bankruptcies = single_strategy_stats(results['all_allc'])
     print(f"  Avg wealth: {mean_w:.2f}, Std dev: {std_w:.2f}, Bankruptcies: {bankruptcies}")
 
     print("\nAll AllD (everyone defects):")
-    mean_w, std_w, bankruptcies = check_single_strategy('AllD', 80, 1000)
+    mean_w, std_w, bankruptcies = single_strategy_stats(results['all_alld'])
     print(f"  Avg wealth: {mean_w:.2f}, Bankruptcies: {bankruptcies}")
 
     print("\n2. Zero Rounds")
-    config = GameConfig(num_rounds=0, initial_wealth=100, num_trials=1)
+    config = GameConfig(num_rounds=0, initial_wealth=100, num_trials=1, fast_forward=False)
     players = run_simulation(config)
     all_100 = all(p.wealth == 100 for p in players)
     no_bankrupt = all(not p.bankrupt for p in players)
     print(f"  All wealth = 100: {all_100}, No bankruptcies: {no_bankrupt}")
 
     print("\n3. Extreme Noise")
-    print(f"No noise: TFT wealth = {check_extreme_parameter('noise', 0.0, 1000):.2f}")
-    print(f"Full noise: TFT wealth = {check_extreme_parameter('noise', 1.0, 1000):.2f}")
+    print(f"No noise: TFT wealth = {tft_wealth(results['noise_0']):.2f}")
+    print(f"Full noise: TFT wealth = {tft_wealth(results['noise_1']):.2f}")
 
     print("CONVERGENCE ANALYSIS")
-    strategies = ['TFT', 'AllD', 'AllC']
-    print(f"Running 100 iterations...")
-    data = run_convergence(100, strategies, 500)
+    data = convergence_curves(results['convergence'], strategies)
 
-    plot_convergence(data, strategies)
-    print("\nConvergence analysis complete. Saved to convergence.png")
+    figure = {'kind': 'convergence', 'args': {'data': data, 'strategies': strategies,
+                                              'filename': 'figures/convergence.png'}}
+    path = save_results('convergence', data, figure)
+    if render_figure:
+        render(path)
+        print("\nConvergence analysis complete. Saved to convergence.png")
 
     for s in strategies:
         if len(data[s]['wealth']) > 0:
-            print(f"  {s}: wealth={data[s]['wealth'][-1]:.2f}, survival={data[s]['survival'][-1]:.2%}")
+            print(f"  {s}: wealth={data[s]['wealth'][-1]:.2f} (se {data[s]['wealth_se']:.2f}), "
+                  f"survival={data[s]['survival'][-1]:.2%}")
+    return results
 
 if __name__ == "__main__":
-    validate()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="sanity checks and convergence analysis")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--no-cache', action='store_true', help="re-run every check")
+    parser.add_argument('--no-render', action='store_true')
+    args = parser.parse_args()
+    validate(args.workers, None if args.no_cache else CACHE_DIR, not args.no_render)